@@ -1,16 +1,32 @@
-import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, stream_with_context, g
 from datetime import datetime, timedelta
-import bcrypt
 import os
 from recommendation.diet_recommendation import DietRecommendationSystem
 from recommendation.workout_recommendation import WorkoutRecommendationSystem
-from flask_mail import Mail, Message
+from recommendation.registry import RecommenderRegistry, dataset_files
+from recommendation.cache import RecommendationCache
+from monitoring.metrics import metrics
+from auth.passwords import HasherBusy, PasswordHasher, calibrate_rounds
+from database.pool import ConnectionPool
+from database.migrations import migrate
+from database.user_data import save_user_data
+from dashboard.store import DEFAULT_PAGE_SIZE, delete_old_todos, fetch_notifications, fetch_todos, parse_cursor, parse_page_limit
+from profiles.cache import ProfileCache
+from tracking.history import DEFAULT_HISTORY_LIMIT, TRACKING_TYPES, fetch_history, parse_history_limit, to_epoch_ms
+from tracking.rollup import PERIODS, aggregate, parse_period_limit
+from tracking.archive import archive_history, export_history
+from tracking.buffer import CoalescingBuffer
+from tracking.engine import TrackingEngine, TrackingError, parse_readings
+from tracking.registry import METRICS
+from flask_mail import Mail
+from mailer.outbox import OutboxWorker, SMTPConnection, enqueue
 from itsdangerous import URLSafeTimedSerializer, BadSignature
 from werkzeug.utils import secure_filename
 from chatbot.chatbot import process_user_input
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
+from contextlib import contextmanager
+import json
 import logging
 
 # Initialize Flask app
@@ -23,6 +39,42 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+MAX_TOPK = 50
+MAX_BATCH_USERS = 10000
+BATCH_CHUNK_USERS = 500
+DIET_DATASET = 'static/datasets/diet_dataset.csv'
+WORKOUT_DATASET = 'static/datasets/workout_dataset.csv'
+# Seconds between checks of the dataset files for a new version; 0 disables watching
+DATASET_POLL_SECONDS = int(os.environ.get('DATASET_POLL_SECONDS', 30))
+# Token expected in the X-Admin-Token header of the admin endpoints; unset disables them
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Recommendation cache: entries per process (or in the shared file), seconds to live, and
+# an optional SQLite file to share cached recommendations between workers
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 10000))
+RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 3600))
+RECOMMENDATION_CACHE_DB = os.environ.get('RECOMMENDATION_CACHE_DB')
+# SQLite page cache per connection (KiB) and memory-mapped I/O size (bytes)
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 65536))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+# Seconds during which +/- clicks on a tracker are merged into one write; 0 writes each click
+TRACKING_COALESCE_SECONDS = float(os.environ.get('TRACKING_COALESCE_SECONDS', 1.0))
+# Days of tracking history kept in tracking_history; older entries move to monthly archive tables (0 keeps all)
+TRACKING_RETENTION_DAYS = int(os.environ.get('TRACKING_RETENTION_DAYS', 365))
+# Profile cache: users per process and seconds before an entry is reloaded, which bounds
+# how long an update made by another worker process can go unseen
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', 60))
+# Password hashing: bcrypt work factor of new hashes (unset: the largest that hashes within
+# BCRYPT_TARGET_MS on this CPU, measured at startup), threads hashing at once, and how many
+# logins/registrations may wait for one before the rest get a 503
+BCRYPT_ROUNDS = os.environ.get('BCRYPT_ROUNDS')
+BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', 500))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+BCRYPT_MAX_QUEUE = int(os.environ.get('BCRYPT_MAX_QUEUE', 32))
+# Outbound mail: seconds between checks of the outbox (new messages also wake the sender)
+# and the SMTP socket timeout
+OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS', 5))
+MAIL_TIMEOUT = float(os.environ.get('MAIL_TIMEOUT', 30))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,31 +82,63 @@ logger = logging.getLogger(__name__)
 
 # Email configuration
 app.config.update(
-    MAIL_SERVER='smtp.gmail.com',
-    MAIL_PORT=587,
-    MAIL_USE_TLS=True,
+    MAIL_SERVER=os.environ.get('MAIL_SERVER', 'smtp.gmail.com'),
+    MAIL_PORT=int(os.environ.get('MAIL_PORT', 587)),
+    MAIL_USE_TLS=os.environ.get('MAIL_USE_TLS', '1') == '1',
     MAIL_USERNAME=os.environ.get('MAIL_USERNAME', 'fitfusion327@gmail.com'),
     MAIL_PASSWORD=os.environ.get('MAIL_PASSWORD')
 )
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', app.config['MAIL_USERNAME'])
 mail = Mail(app)
 
-# Initialize recommendation systems and store in app.config
+# Initialize recommendation systems; requests fetch the active version from the registry
+recommenders = RecommenderRegistry()
 with app.app_context():
     try:
-        app.config['DIET_RECOMMENDER'] = DietRecommendationSystem('static/datasets/diet_dataset.csv')
-        app.config['WORKOUT_RECOMMENDER'] = WorkoutRecommendationSystem('static/datasets/workout_dataset.csv')
+        recommenders.register('diet', lambda: DietRecommendationSystem(DIET_DATASET), dataset_files(DIET_DATASET))
+        # WORKOUT_ANSWER_TABLE: 'lazy' (default), 'eager' or '' to disable the precomputed answers
+        recommenders.register('workout', lambda: WorkoutRecommendationSystem(
+            WORKOUT_DATASET,
+            answer_table=os.environ.get('WORKOUT_ANSWER_TABLE', 'lazy') or None
+        ), dataset_files(WORKOUT_DATASET))
         logger.info("Recommendation systems initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing recommenders: {e}")
         raise
 
+recommendation_cache = RecommendationCache(RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL, RECOMMENDATION_CACHE_DB)
+recommenders.on_swap(lambda name, loaded: recommendation_cache.invalidate(name, keep_version=loaded.version))
+
+def recommend_plan(kind, user_input):
+    """Best diet or workout plan for a user input, memoized per dataset version."""
+    loaded = recommenders.current(kind)
+    recommender = loaded.recommender
+    recommend = recommender.recommend_diet if kind == 'diet' else recommender.recommend_workout
+    return recommendation_cache.get_or_compute(
+        kind, loaded.version, recommender.normalize_input(user_input), lambda: recommend(user_input)
+    )
+
+db_pool = ConnectionPool('fitfusion.db', cache_size_kb=DB_CACHE_SIZE_KB, mmap_size=DB_MMAP_SIZE)
+password_hasher = PasswordHasher(BCRYPT_WORKERS, BCRYPT_MAX_QUEUE,
+                                 int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else calibrate_rounds(BCRYPT_TARGET_MS / 1000))
+atexit.register(password_hasher.close)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_db_connection():
-    conn = sqlite3.connect('fitfusion.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """This thread's pooled connection; `close()` hands it back to the pool."""
+    return db_pool.acquire()
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    db_pool.release_current()
+
+def password_hasher_busy(template, **context):
+    """503 for an auth form when the password hasher's queue is full."""
+    flash('Too many sign-in requests right now. Please try again in a moment.', 'error')
+    logger.warning(f"{request.endpoint} rejected: password hasher queue full")
+    return render_template(template, **context), 503, {'Retry-After': '1'}
 
 def get_user_data_dict(user_data, email):
     """Helper function to create user_data_dict with defaults."""
@@ -87,148 +171,94 @@ def get_user_data_dict(user_data, email):
         user_data_dict.setdefault(key, value)
     return user_data_dict
 
+def load_profile(user_id):
+    conn = get_db_connection()
+    user = conn.execute('SELECT id, name, email, created_at, last_login FROM users WHERE id = ?', (user_id,)).fetchone()
+    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    user = dict(user) if user else None
+    return user, (get_user_data_dict(user_data, user['email'] if user else None) if user_data else None)
+
+profile_cache = ProfileCache(load_profile, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+def get_profile(user_id):
+    """The user's row and user_data dict (None if missing), memoized for the request and cached across requests."""
+    profiles = g.setdefault('profiles', {})
+    if user_id not in profiles:
+        profiles[user_id] = profile_cache.get(user_id)
+    return profiles[user_id]
+
+def invalidate_profile(user_id):
+    """Call after changing a user's users or user_data row."""
+    g.get('profiles', {}).pop(user_id, None)
+    profile_cache.invalidate(user_id)
+
 def init_db():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL DEFAULT '',
-            email TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        )
-    ''')
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [col[1] for col in cursor.fetchall()]
-    if 'name' not in columns:
-        cursor.execute('ALTER TABLE users ADD COLUMN name TEXT NOT NULL DEFAULT ""')
-    
-    # Create user_data table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            gender TEXT NOT NULL,
-            age INTEGER NOT NULL,
-            weight REAL NOT NULL,
-            height REAL NOT NULL,
-            water_intake REAL DEFAULT 1.9,
-            water_goal REAL DEFAULT 3.0,
-            steps_count INTEGER DEFAULT 0,
-            steps_goal INTEGER DEFAULT 10000,
-            workout_calories REAL DEFAULT 0,
-            workout_goal REAL DEFAULT 500,
-            sleep_duration REAL DEFAULT 0,
-            sleep_goal REAL DEFAULT 8.0,
-            exercise_hours REAL DEFAULT 0,
-            mood TEXT DEFAULT 'Neutral',
-            avatar_url TEXT,
-            phone TEXT,
-            email TEXT,
-            dob TEXT,
-            goal TEXT,
-            theme TEXT DEFAULT 'light',
-            language TEXT DEFAULT 'en',
-            notification_frequency TEXT DEFAULT 'daily',
-            units TEXT DEFAULT 'metric',
-            data_sharing BOOLEAN DEFAULT FALSE,
-            auto_sync BOOLEAN DEFAULT FALSE,
-            notifications BOOLEAN DEFAULT TRUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Check and add missing columns to user_data
-    cursor.execute("PRAGMA table_info(user_data)")
-    columns = {col[1]: col for col in cursor.fetchall()}
-    required_columns = {
-        'water_intake': 'REAL DEFAULT 1.9',
-        'water_goal': 'REAL DEFAULT 3.0',
-        'steps_count': 'INTEGER DEFAULT 0',
-        'steps_goal': 'INTEGER DEFAULT 10000',
-        'workout_calories': 'REAL DEFAULT 0',
-        'workout_goal': 'REAL DEFAULT 500',
-        'sleep_duration': 'REAL DEFAULT 0',
-        'sleep_goal': 'REAL DEFAULT 8.0',
-        'exercise_hours': 'REAL DEFAULT 0',
-        'mood': 'TEXT DEFAULT "Neutral"',
-        'avatar_url': 'TEXT',
-        'phone': 'TEXT',
-        'email': 'TEXT',
-        'dob': 'TEXT',
-        'goal': 'TEXT',
-        'theme': 'TEXT DEFAULT "light"',
-        'language': 'TEXT DEFAULT "en"',
-        'notification_frequency': 'TEXT DEFAULT "daily"',
-        'units': 'TEXT DEFAULT "metric"',
-        'data_sharing': 'BOOLEAN DEFAULT FALSE',
-        'auto_sync': 'BOOLEAN DEFAULT FALSE',
-        'notifications': 'BOOLEAN DEFAULT TRUE'
-    }
-    for col, col_type in required_columns.items():
-        if col not in columns:
-            cursor.execute(f'ALTER TABLE user_data ADD COLUMN {col} {col_type}')
-    
-    # Handle column renaming or dropping
-    if 'water_max' in columns and 'water_goal' not in columns:
-        cursor.execute('ALTER TABLE user_data RENAME COLUMN water_max TO water_goal')
-    if 'workout_duration' in columns:
-        cursor.execute('ALTER TABLE user_data DROP COLUMN workout_duration')
-    
-    # Create other tables
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tracking_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            value TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS todos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            task TEXT NOT NULL,
-            completed BOOLEAN DEFAULT FALSE,
-            date DATE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            message TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
+    migrate(conn)
+    conn.close()
     
     # Create uploads directory
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
-    
-    conn.commit()
-    conn.close()
 
 def clear_old_todos():
     with app.app_context():
         conn = get_db_connection()
-        today = datetime.now().strftime('%Y-%m-%d')
-        conn.execute('DELETE FROM todos WHERE date < ?', (today,))
-        conn.commit()
-        conn.close()
+        try:
+            delete_old_todos(conn, datetime.now().strftime('%Y-%m-%d'))
+        except Exception as e:
+            logger.error(f"Clearing old todos failed: {e}")
+        finally:
+            conn.close()
+
+def archive_tracking_history():
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            archive_history(conn, TRACKING_RETENTION_DAYS)
+        except Exception as e:
+            logger.error(f"Archiving tracking history failed: {e}")
+        finally:
+            conn.close()
+
+tracking_buffer = None
+if TRACKING_COALESCE_SECONDS > 0:
+    tracking_buffer = CoalescingBuffer(get_db_connection, METRICS, window=TRACKING_COALESCE_SECONDS,
+                                       on_write=profile_cache.invalidate)
+    atexit.register(tracking_buffer.close)
+tracking_engine = TrackingEngine(get_db_connection, METRICS, tracking_buffer, on_write=profile_cache.invalidate,
+                                 retention_days=TRACKING_RETENTION_DAYS)
+# Update endpoints generated from the metric registry, by endpoint name
+TRACKING_ENDPOINTS = {f'update_{metric.name}': metric for metric in METRICS.values() if metric.url}
+
+def is_buffered_click():
+    metric = TRACKING_ENDPOINTS.get(request.endpoint)
+    if metric is None:
+        return False
+    data = request.get_json(silent=True) or {}
+    return tracking_engine.is_buffered(metric, data.get('action', metric.default_action))
+
+@app.before_request
+def flush_tracking_buffer():
+    """Write the user's buffered clicks before any other request reads or changes their data.
+
+    A failed flush leaves the clicks queued for the background thread; the request
+    goes on with the stored data rather than failing every page until the database
+    recovers.
+    """
+    if tracking_buffer is not None and 'user_id' in session and not is_buffered_click():
+        try:
+            tracking_buffer.flush_user(session['user_id'])
+        except Exception as e:
+            logger.warning(f"Serving {request.path} for user {session.get('email')} without their buffered clicks: {e}")
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(func=clear_old_todos, trigger='interval', days=1)
+if TRACKING_RETENTION_DAYS > 0:
+    scheduler.add_job(func=archive_tracking_history, trigger='interval', days=1)
+if DATASET_POLL_SECONDS > 0:
+    scheduler.add_job(func=recommenders.check_for_changes, trigger='interval', seconds=DATASET_POLL_SECONDS)
 scheduler.start()
 atexit.register(lambda: scheduler.shutdown())
 
@@ -236,6 +266,15 @@ atexit.register(lambda: scheduler.shutdown())
 with app.app_context():
     init_db()
 
+@contextmanager
+def mail_connection():
+    with app.app_context(), SMTPConnection(mail.state, MAIL_TIMEOUT) as connection:
+        yield connection
+
+outbox_worker = OutboxWorker(get_db_connection, mail_connection, app.config['MAIL_DEFAULT_SENDER'],
+                             poll_seconds=OUTBOX_POLL_SECONDS)
+atexit.register(outbox_worker.close)
+
 @app.route('/')
 def index():
     if 'user_id' in session:
@@ -251,13 +290,32 @@ def login():
         password = request.form.get('password').encode('utf-8')
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-        if user and bcrypt.checkpw(password, user['password_hash']):
+        try:
+            authenticated = user is not None and password_hasher.check(password, user['password_hash'])
+        except HasherBusy:
+            conn.close()
+            return password_hasher_busy('login.html')
+        if authenticated:
             session.permanent = True
             session['user_id'] = user['id']
             session['email'] = user['email']
             session['name'] = user['name'] if 'name' in user else ''
+            # Hashes made with another work factor are redone while the password is at hand;
+            # hashing before the writes keeps the database lock short.
+            new_hash = None
+            if password_hasher.needs_rehash(user['password_hash']):
+                try:
+                    new_hash = password_hasher.hash(password)
+                except HasherBusy:
+                    logger.info(f"Skipped rehashing the password of {email}: password hasher queue full")
             conn.execute('UPDATE users SET last_login = ? WHERE id = ?', (datetime.now(), user['id']))
+            if new_hash is not None:
+                # Only replaces the hash just checked, not one a password reset wrote meanwhile.
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                             (new_hash, user['id'], user['password_hash']))
+                metrics.incr('password_hasher.rehashed')
             conn.commit()
+            invalidate_profile(user['id'])
             user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (user['id'],)).fetchone()
             conn.close()
             logger.info(f"User {email} logged in successfully")
@@ -294,7 +352,11 @@ def register():
             flash('Email already exists', 'error')
             logger.warning(f"Registration failed: Email {email} already exists")
             return render_template('register.html')
-        password_hash = bcrypt.hashpw(password, bcrypt.gensalt())
+        try:
+            password_hash = password_hasher.hash(password)
+        except HasherBusy:
+            conn.close()
+            return password_hasher_busy('register.html')
         cursor = conn.cursor()
         cursor.execute('INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)', ('', email, password_hash))
         user_id = cursor.lastrowid
@@ -349,11 +411,10 @@ def user_data():
                     logger.warning(f"User data submission failed: Invalid height {height}")
                 else:
                     conn.execute('UPDATE users SET name = ? WHERE id = ?', (name, session['user_id']))
-                    conn.execute('''
-                        INSERT INTO user_data (user_id, gender, age, weight, height, goal)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (session['user_id'], gender, age, weight, height, goal))
+                    save_user_data(conn, session['user_id'], {'gender': gender, 'age': age, 'weight': weight,
+                                                              'height': height, 'goal': goal})
                     conn.commit()
+                    invalidate_profile(session['user_id'])
                     session['name'] = name
                     conn.close()
                     logger.info(f"User {session['email']} submitted user data successfully")
@@ -374,13 +435,9 @@ def welcome():
 def profile():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template('profile.html', name=user['name'], user_data=user_data_dict)
 
 @app.route('/update_avatar', methods=['POST'])
@@ -403,9 +460,10 @@ def update_avatar():
         file.save(file_path)
         avatar_url = url_for('static', filename=f'uploads/{unique_filename}')
         conn = get_db_connection()
-        conn.execute('UPDATE user_data SET avatar_url = ? WHERE user_id = ?', (avatar_url, session['user_id']))
+        save_user_data(conn, session['user_id'], {'avatar_url': avatar_url})
         conn.commit()
         conn.close()
+        invalidate_profile(session['user_id'])
         flash('Avatar updated successfully', 'success')
         logger.info(f"Avatar updated for user {session['email']}")
         return redirect(url_for('profile'))
@@ -458,31 +516,21 @@ def update_profile():
     
     conn = get_db_connection()
     conn.execute('UPDATE users SET name = ? WHERE id = ?', (name, session['user_id']))
-    update_fields = []
-    update_values = []
+    update_fields = {}
     if height is not None:
-        update_fields.append('height = ?')
-        update_values.append(height)
+        update_fields['height'] = height
     if weight is not None:
-        update_fields.append('weight = ?')
-        update_values.append(weight)
+        update_fields['weight'] = weight
     if age is not None:
-        update_fields.append('age = ?')
-        update_values.append(age)
-    update_fields.append('phone = ?')
-    update_values.append(phone or '')
-    update_fields.append('email = ?')
-    update_values.append(email or session['email'])
-    update_fields.append('dob = ?')
-    update_values.append(dob or '')
-    
-    if update_fields:
-        query = f'UPDATE user_data SET {", ".join(update_fields)} WHERE user_id = ?'
-        update_values.append(session['user_id'])
-        conn.execute(query, update_values)
+        update_fields['age'] = age
+    update_fields['phone'] = phone or ''
+    update_fields['email'] = email or session['email']
+    update_fields['dob'] = dob or ''
+    save_user_data(conn, session['user_id'], update_fields)
     
     conn.commit()
     conn.close()
+    invalidate_profile(session['user_id'])
     session['name'] = name
     flash('Profile updated successfully', 'success')
     logger.info(f"Profile updated for user {session['email']}")
@@ -518,19 +566,18 @@ def update_settings():
         return redirect(url_for('profile'))
     
     conn = get_db_connection()
-    conn.execute('''
-        UPDATE user_data SET
-            theme = ?,
-            language = ?,
-            notification_frequency = ?,
-            units = ?,
-            data_sharing = ?,
-            auto_sync = ?,
-            notifications = ?
-        WHERE user_id = ?
-    ''', (theme, language, notification_frequency, units, data_sharing, auto_sync, notifications, session['user_id']))
+    save_user_data(conn, session['user_id'], {
+        'theme': theme,
+        'language': language,
+        'notification_frequency': notification_frequency,
+        'units': units,
+        'data_sharing': data_sharing,
+        'auto_sync': auto_sync,
+        'notifications': notifications
+    })
     conn.commit()
     conn.close()
+    invalidate_profile(session['user_id'])
     flash('Settings updated successfully', 'success')
     logger.info(f"Settings updated for user {session['email']}")
     return redirect(url_for('profile'))
@@ -539,21 +586,17 @@ def update_settings():
 def progress():
     if 'user_id' not in session:
         return redirect(url_for('login'))
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
+        return redirect(url_for('user_data'))
+    try:
+        limit = parse_history_limit(request.args.get('limit'))
+    except ValueError:
+        limit = DEFAULT_HISTORY_LIMIT
     conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    history = {}
-    metrics = ['weight', 'water', 'steps', 'workout', 'sleep', 'mood']
-    for metric in metrics:
-        rows = conn.execute(
-            'SELECT value, timestamp FROM tracking_history WHERE user_id = ? AND type = ? ORDER BY timestamp DESC LIMIT 7',
-            (session['user_id'], metric)
-        ).fetchall()
-        history[metric] = [{'value': row['value'], 'date': row['timestamp']} for row in rows]
+    history = fetch_history(conn, session['user_id'], ['weight', 'water', 'steps', 'workout', 'sleep', 'mood'],
+                            limit, time_key='date')
     conn.close()
-    if not user_data:
-        return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template('progress.html', user=user, user_data=user_data_dict, history=history, name=user['name'])
 
 @app.route('/api/update_progress', methods=['POST'])
@@ -563,44 +606,28 @@ def update_progress():
     data = request.get_json()
     action = data.get('action')
     user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT water_intake, water_goal, steps_count, steps_goal, mood FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    water_intake = float(tracking['water_intake']) if tracking else 1.9
-    water_goal = float(tracking['water_goal']) if tracking else 3.0
-    steps_count = tracking['steps_count'] if tracking else 0
-    steps_goal = tracking['steps_goal'] if tracking else 10000
-    mood = tracking['mood'] if tracking else 'Neutral'
     timestamp = data.get('timestamp', datetime.now().isoformat())
-    try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Progress update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    if action == 'set_water_intake':
-        water_intake = float(data.get('value', water_intake))
-        if water_intake < 0 or water_intake > water_goal:
-            logger.warning(f"Progress update failed: Invalid water intake {water_intake}")
-            return jsonify({'error': f'Water intake must be between 0 and {water_goal} liters'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'water', water_intake, timestamp))
-        conn.execute('UPDATE user_data SET water_intake = ? WHERE user_id = ?', (water_intake, user_id))
-    elif action == 'set_steps_goal':
-        steps_goal = int(data.get('value', steps_goal))
-        steps_goal = max(min(steps_goal, 100000), 1000)
-        conn.execute('UPDATE user_data SET steps_goal = ? WHERE user_id = ?', (steps_goal, user_id))
-    elif action == 'set_mood':
-        mood = data.get('value', mood)
-        if mood not in ['Happy', 'Neutral', 'Sad']:
-            logger.warning(f"Progress update failed: Invalid mood {mood}")
-            return jsonify({'error': 'Invalid mood value'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'mood', mood, timestamp))
-        conn.execute('UPDATE user_data SET mood = ? WHERE user_id = ?', (mood, user_id))
-    else:
+    # Each progress action is a plain update of one registry metric: (metric, action, value key).
+    updates = {
+        'set_water_intake': ('water', 'set', 'value'),
+        'set_steps_goal': ('steps', 'set_goal', 'goal'),
+        'set_mood': ('mood', 'set', 'value'),
+    }
+    if action not in updates:
         logger.warning(f"Progress update failed: Invalid action {action}")
         return jsonify({'error': 'Invalid action'}), 400
-    conn.commit()
-    conn.close()
+    name, metric_action, key = updates[action]
+    update = {'action': metric_action, 'timestamp': timestamp}
+    if 'value' in data:
+        update[key] = data['value']
+    try:
+        tracking_engine.update(user_id, name, update)
+    except TrackingError as e:
+        logger.warning(f"Progress update failed: {e}")
+        return jsonify({'error': str(e)}), 400
+    water_intake, water_goal = tracking_engine.read(user_id, 'water')
+    steps_count, steps_goal = tracking_engine.read(user_id, 'steps')
+    mood, _ = tracking_engine.read(user_id, 'mood')
     logger.info(f"Progress updated for user {session['email']}: action={action}")
     return jsonify({
         'intake': water_intake,
@@ -615,87 +642,64 @@ def update_progress():
 def home():
     if 'user_id' not in session:
         return redirect(url_for('login'))
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
+        return redirect(url_for('user_data'))
     conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
     today = datetime.now().strftime('%Y-%m-%d')
-    todos = conn.execute('SELECT * FROM todos WHERE user_id = ? AND date = ?', 
-                        (session['user_id'], today)).fetchall()
-    notifications = conn.execute('SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC', 
-                               (session['user_id'],)).fetchall()
+    # The page edits the list in place, so it needs the whole day rather than a first page.
+    todos, _ = fetch_todos(conn, session['user_id'], today, limit=None)
+    notifications, notifications_next = fetch_notifications(conn, session['user_id'], limit=DEFAULT_PAGE_SIZE)
     conn.close()
-    if not user_data:
-        return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     bmi = round(user_data_dict['weight'] / ((user_data_dict['height'] / 100) ** 2), 1)
     bmi_status = 'Underweight' if bmi < 18.5 else 'Normal' if bmi < 25 else 'Overweight' if bmi < 30 else 'Obese'
     return render_template('home.html', user=user, user_data=user_data_dict, bmi=bmi, bmi_status=bmi_status, 
-                          todos=todos, notifications=notifications)
+                          todos=todos, notifications=notifications, notifications_next=notifications_next)
 
 @app.route('/weight')
 def weight():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user_row = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user = dict(user_row) if user_row else {'id': session['user_id'], 'name': session['name'], 'email': session['email']}
-    user_data_dict = get_user_data_dict(user_data, session['email'])
+    user = user or {'id': session['user_id'], 'name': session['name'], 'email': session['email']}
     return render_template('weight.html', user=user, user_data=user_data_dict)
 
 @app.route('/workout')
 def workout():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template('workout.html', user=user, user_data=user_data_dict, recommendation=None, email=session['email'], name=session['name'])
 
 @app.route('/steps')
 def steps():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template('steps.html', user=user, user_data=user_data_dict)
 
 @app.route('/sleep')
 def sleep():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template('sleep.html', user=user, user_data=user_data_dict)
 
 @app.route('/water')
 def water():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template('water.html', user=user, user_data=user_data_dict)
 
 @app.route('/chatbot')
@@ -741,15 +745,12 @@ def forgot_password():
         if user:
             s = URLSafeTimedSerializer(app.secret_key)
             token = s.dumps(email, salt='password-reset-salt')
-            msg = Message('Password Reset Request', recipients=[email])
-            msg.body = f'Click this link to reset your password: {url_for("reset_password", token=token, _external=True)}'
-            try:
-                mail.send(msg)
-                flash(f'A password reset link has been sent to {email}', 'success')
-                logger.info(f"Password reset email sent to {email}")
-            except Exception as e:
-                flash(f'Failed to send email: {str(e)}', 'error')
-                logger.error(f"Failed to send password reset email to {email}: {str(e)}")
+            body = f'Click this link to reset your password: {url_for("reset_password", token=token, _external=True)}'
+            enqueue(conn, email, 'Password Reset Request', body)
+            conn.commit()
+            outbox_worker.wake()
+            flash(f'A password reset link has been sent to {email}', 'success')
+            logger.info(f"Password reset email queued for {email}")
         else:
             flash('Email not found', 'error')
             logger.warning(f"Password reset failed: Email {email} not found")
@@ -757,7 +758,7 @@ def forgot_password():
     return render_template('forgot_password.html')
 
 @app.route('/reset_password/<token>', methods=['GET', 'POST'])
-def reset_password():
+def reset_password(token):
     if 'user_id' in session:
         return redirect(url_for('home'))
     s = URLSafeTimedSerializer(app.secret_key)
@@ -778,8 +779,11 @@ def reset_password():
             flash('Password must be at least 8 characters long', 'error')
             logger.warning(f"Password reset failed: Password too short for email {email}")
             return render_template('reset_password.html', token=token)
+        try:
+            password_hash = password_hasher.hash(new_password)
+        except HasherBusy:
+            return password_hasher_busy('reset_password.html', token=token)
         conn = get_db_connection()
-        password_hash = bcrypt.hashpw(new_password, bcrypt.gensalt())
         conn.execute('UPDATE users SET password_hash = ? WHERE email = ?', (password_hash, email))
         conn.commit()
         conn.close()
@@ -805,13 +809,9 @@ def logout():
 def recommendations():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     return render_template(
         'recommendations.html',
         user=user,
@@ -830,13 +830,9 @@ def recommendations():
 def recommend_diet():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     try:
         age = int(request.form.get('age', user_data_dict['age']))
         if age < 1 or age > 120:
@@ -863,7 +859,7 @@ def recommend_diet():
             'Activity_Level': activity_level
         }
         logger.info(f"Diet recommendation input: {user_input}")
-        diet_recommendation = app.config['DIET_RECOMMENDER'].recommend_diet(user_input)
+        diet_recommendation = recommend_plan('diet', user_input)
         if diet_recommendation and all(key in diet_recommendation for key in ['Breakfast', 'Mid-Morning', 'Lunch', 'Evening Snack', 'Dinner', 'Post-Dinner', 'Total Calories']):
             session['diet_recommendation'] = diet_recommendation
             session['diet_error'] = None
@@ -911,13 +907,9 @@ def recommend_diet():
 def recommend_workout():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    user_data = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (session['user_id'],)).fetchone()
-    conn.close()
-    if not user_data:
+    user, user_data_dict = get_profile(session['user_id'])
+    if not user_data_dict:
         return redirect(url_for('user_data'))
-    user_data_dict = get_user_data_dict(user_data, session['email'])
     try:
         age = int(request.form.get('age', user_data_dict['age']))
         if age < 1 or age > 120:
@@ -946,7 +938,7 @@ def recommend_workout():
             'Workout_Time_per_day_mins': time
         }
         logger.info(f"Workout recommendation input: {user_input}")
-        workout_recommendation = app.config['WORKOUT_RECOMMENDER'].recommend_workout(user_input)
+        workout_recommendation = recommend_plan('workout', user_input)
         if workout_recommendation and all(key in workout_recommendation for key in ['Workout_Type', 'Exercises', 'Duration']):
             session['workout_recommendation'] = workout_recommendation
             session['workout_error'] = None
@@ -984,34 +976,72 @@ def recommend_workout():
         logger.error(f"Workout recommendation error: {str(e)}")
     return redirect(url_for('recommendations'))
 
+def parse_workout_request(data):
+    """Validate a JSON workout request and build the recommender input."""
+    fitness_level = data.get('fitness_level', 'Intermediate')
+    if fitness_level not in ['Beginner', 'Intermediate', 'Advanced']:
+        raise ValueError("Invalid fitness level")
+    goal = data.get('goal', 'Strength')
+    if goal not in ['Strength', 'Endurance', 'Flexibility', 'Weight Loss']:
+        raise ValueError("Invalid goal")
+    preference = data.get('preference', 'Home')
+    if preference not in ['Home', 'Gym', 'Outdoor']:
+        raise ValueError("Invalid workout preference")
+    time = int(data.get('time', 60))
+    if time < 10 or time > 240:
+        raise ValueError("Workout time must be between 10 and 240 minutes")
+    return {
+        'Age': data.get('age', 30),  # Default age if not provided
+        'Gender': data.get('gender', 'Male'),  # Default gender if not provided
+        'Fitness_Level': fitness_level,
+        'Goal': goal,
+        'Workout_Preference': preference,
+        'Workout_Time_per_day_mins': time
+    }
+
+def parse_diet_request(data):
+    """Validate a JSON diet request and build the recommender input."""
+    age = int(data.get('age', 30))
+    if age < 1 or age > 120:
+        raise ValueError("Age must be between 1 and 120")
+    gender = data.get('gender', 'Male')
+    if gender not in ['Male', 'Female']:
+        raise ValueError("Invalid gender")
+    goal = data.get('goal')
+    if goal not in ['Lose Weight', 'Gain Muscle', 'Maintain Weight']:
+        raise ValueError("Invalid goal")
+    diet_type = data.get('diet_type')
+    if diet_type not in ['Vegan', 'Vegetarian', 'Non-Vegetarian', 'Eggetarian']:
+        raise ValueError("Invalid diet type")
+    activity_level = data.get('activity_level')
+    if activity_level not in ['Sedentary', 'Lightly Active', 'Moderately Active', 'Very Active', 'Super Active']:
+        raise ValueError("Invalid activity level")
+    return {
+        'Age': age,
+        'Gender': gender,
+        'Goal': goal,
+        'Diet_Type': diet_type,
+        'Allergies': data.get('allergies', 'None'),
+        'Medical_Conditions': data.get('medical_conditions', 'None'),
+        'Activity_Level': activity_level
+    }
+
+def parse_topk(data):
+    """Number of alternatives requested, between 1 and MAX_TOPK."""
+    k = int(data.get('k', 5))
+    if k < 1 or k > MAX_TOPK:
+        raise ValueError(f"k must be between 1 and {MAX_TOPK}")
+    return k
+
 @app.route('/api/recommend_workout', methods=['POST'])
 def api_recommend_workout():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     data = request.get_json()
     try:
-        fitness_level = data.get('fitness_level', 'Intermediate')
-        if fitness_level not in ['Beginner', 'Intermediate', 'Advanced']:
-            raise ValueError("Invalid fitness level")
-        goal = data.get('goal', 'Strength')
-        if goal not in ['Strength', 'Endurance', 'Flexibility', 'Weight Loss']:
-            raise ValueError("Invalid goal")
-        preference = data.get('preference', 'Home')
-        if preference not in ['Home', 'Gym', 'Outdoor']:
-            raise ValueError("Invalid workout preference")
-        time = int(data.get('time', 60))
-        if time < 10 or time > 240:
-            raise ValueError("Workout time must be between 10 and 240 minutes")
-        user_input = {
-            'Age': data.get('age', 30),  # Default age if not provided
-            'Gender': data.get('gender', 'Male'),  # Default gender if not provided
-            'Fitness_Level': fitness_level,
-            'Goal': goal,
-            'Workout_Preference': preference,
-            'Workout_Time_per_day_mins': time
-        }
+        user_input = parse_workout_request(data)
         logger.info(f"API workout recommendation input: {user_input}")
-        recommendation = app.config['WORKOUT_RECOMMENDER'].recommend_workout(user_input)
+        recommendation = recommend_plan('workout', user_input)
         if recommendation and all(key in recommendation for key in ['Workout_Type', 'Exercises', 'Duration']):
             logger.info(f"API returning workout recommendation: {recommendation}")
             return jsonify({
@@ -1029,266 +1059,132 @@ def api_recommend_workout():
         logger.error(f"API workout recommendation error: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred.'}), 500
 
-@app.route('/api/update_water', methods=['POST'])
-def update_water():
+@app.route('/api/recommend_workout_topk', methods=['POST'])
+def api_recommend_workout_topk():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     data = request.get_json()
-    action = data.get('action')
-    user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT water_intake, water_goal FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    water_intake = float(tracking['water_intake']) if tracking else 1.9
-    water_goal = float(tracking['water_goal']) if tracking else 3.0
-    timestamp = data.get('timestamp', datetime.now().isoformat())
     try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Water update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    
-    # Round water_intake to 1 decimal place to avoid floating-point errors
-    water_intake = round(water_intake, 1)
-    
-    if action == 'set':
-        water_intake = float(data.get('value', water_intake))
-        if water_intake < 0 or water_intake > water_goal:
-            logger.warning(f"Water update failed: Invalid intake {water_intake}")
-            return jsonify({'error': 'Water intake must be between 0 and goal liters'}), 400
-        water_intake = round(water_intake, 1)  # Round after setting
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'water', water_intake, timestamp))
-    elif action == 'increase':
-        water_intake = min(water_intake + 0.1, water_goal)
-        water_intake = round(water_intake, 1)  # Round after increasing
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'water', water_intake, timestamp))
-    elif action == 'decrease':
-        water_intake = max(water_intake - 0.1, 0)
-        water_intake = round(water_intake, 1)  # Round after decreasing
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'water', water_intake, timestamp))
-    elif action == 'set_max':
-        water_goal = float(data.get('max', water_goal))
-        water_goal = max(min(water_goal, 10), 0.5)
-        water_intake = min(water_intake, water_goal)
-        water_intake = round(water_intake, 1)  # Round after adjustment
-    
-    conn.execute('UPDATE user_data SET water_intake = ?, water_goal = ? WHERE user_id = ?', 
-                 (water_intake, water_goal, user_id))
-    conn.commit()
-    conn.close()
-    logger.info(f"Water updated for user {session['email']}: action={action}, intake={water_intake}, goal={water_goal}")
-    return jsonify({'intake': water_intake, 'max': water_goal, 'last_updated': timestamp})
+        user_input = parse_workout_request(data)
+        k = parse_topk(data)
+        logger.info(f"API top-{k} workout recommendation input: {user_input}")
+        recommendations = recommenders.get('workout').recommend_workout_topk(user_input, k)
+        return jsonify({'recommendations': [{
+            'workout_type': recommendation['Workout_Type'],
+            'exercises': recommendation['Exercises'],
+            'duration': recommendation['Duration']
+        } for recommendation in recommendations]})
+    except ValueError as e:
+        logger.warning(f"API top-k workout recommendation failed: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API top-k workout recommendation error: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred.'}), 500
 
-@app.route('/api/update_weight', methods=['POST'])
-def update_weight():
+@app.route('/api/recommend_diet_topk', methods=['POST'])
+def api_recommend_diet_topk():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     data = request.get_json()
-    action = data.get('action', 'set')
-    user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT weight FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    weight = tracking['weight'] if tracking else 0
-    timestamp = data.get('timestamp', datetime.now().isoformat())
     try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Weight update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    if action == 'set':
-        weight = float(data.get('value', weight))
-        if weight < 0.1 or weight > 500:
-            logger.warning(f"Weight update failed: Invalid weight {weight}")
-            return jsonify({'error': 'Weight must be between 0.1 and 500 kg'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'weight', weight, timestamp))
-    elif action == 'increase':
-        weight = min(weight + 0.1, 500)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'weight', weight, timestamp))
-    elif action == 'decrease':
-        weight = max(weight - 0.1, 0.1)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'weight', weight, timestamp))
-    conn.execute('UPDATE user_data SET weight = ? WHERE user_id = ?', (weight, user_id))
-    conn.commit()
-    conn.close()
-    logger.info(f"Weight updated for user {session['email']}: action={action}, weight={weight}")
-    return jsonify({'value': weight, 'last_updated': timestamp})
+        user_input = parse_diet_request(data)
+        k = parse_topk(data)
+        logger.info(f"API top-{k} diet recommendation input: {user_input}")
+        recommendations = recommenders.get('diet').recommend_diet_topk(user_input, k)
+        return jsonify({'recommendations': recommendations})
+    except ValueError as e:
+        logger.warning(f"API top-k diet recommendation failed: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API top-k diet recommendation error: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred.'}), 500
 
-@app.route('/api/update_workout', methods=['POST'])
-def update_workout():
+@app.route('/api/recommend/batch', methods=['POST'])
+def api_recommend_batch():
+    """Recommend plans for a list of users, streamed back as one NDJSON line per user."""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     data = request.get_json()
-    action = data.get('action', 'set')
-    user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT workout_calories, workout_goal FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    calories = tracking['workout_calories'] if tracking else 0
-    goal = tracking['workout_goal'] if tracking else 500
-    timestamp = data.get('timestamp', datetime.now().isoformat())
-    try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Workout update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    if action == 'set':
-        calories = float(data.get('value', calories))
-        if calories < 0 or calories > 2000:
-            logger.warning(f"Workout update failed: Invalid calories {calories}")
-            return jsonify({'error': 'Calories must be between 0 and 2000'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'workout', calories, timestamp))
-    elif action == 'increase':
-        calories = min(calories + 10, 2000)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'workout', calories, timestamp))
-    elif action == 'decrease':
-        calories = max(calories - 10, 0)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'workout', calories, timestamp))
-    elif action == 'set_goal':
-        goal = float(data.get('goal', goal))
-        goal = max(min(goal, 2000), 100)
-    conn.execute('UPDATE user_data SET workout_calories = ?, workout_goal = ? WHERE user_id = ?', 
-                 (calories, goal, user_id))
-    conn.commit()
-    conn.close()
-    logger.info(f"Workout updated for user {session['email']}: action={action}, calories={calories}, goal={goal}")
-    return jsonify({'calories': calories, 'goal': goal, 'last_updated': timestamp})
+    kind = data.get('type')
+    users = data.get('users')
+    if kind not in ['diet', 'workout']:
+        return jsonify({'error': 'type must be diet or workout'}), 400
+    if not isinstance(users, list) or len(users) > MAX_BATCH_USERS:
+        return jsonify({'error': f'users must be a list of at most {MAX_BATCH_USERS} inputs'}), 400
+    parse = parse_diet_request if kind == 'diet' else parse_workout_request
+    recommender = recommenders.get(kind)
+    recommend_batch = recommender.recommend_diet_batch if kind == 'diet' else recommender.recommend_workout_batch
+    logger.info(f"Batch {kind} recommendation for {len(users)} users requested by {session['email']}")
 
-@app.route('/api/update_steps', methods=['POST'])
-def update_steps():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    data = request.get_json()
-    action = data.get('action', 'set')
-    user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT steps_count, steps_goal FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    count = tracking['steps_count'] if tracking else 0
-    goal = tracking['steps_goal'] if tracking else 10000
-    timestamp = data.get('timestamp', datetime.now().isoformat())
-    try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Steps update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    if action == 'set':
-        count = int(data.get('value', count))
-        if count < 0 or count > 100000:
-            logger.warning(f"Steps update failed: Invalid steps {count}")
-            return jsonify({'error': 'Steps must be between 0 and 100000'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'steps', count, timestamp))
-    elif action == 'increase':
-        count = min(count + 100, 100000)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'steps', count, timestamp))
-    elif action == 'decrease':
-        count = max(count - 100, 0)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'steps', count, timestamp))
-    elif action == 'set_goal':
-        goal = int(data.get('goal', goal))
-        goal = max(min(goal, 100000), 1000)
-    conn.execute('UPDATE user_data SET steps_count = ?, steps_goal = ? WHERE user_id = ?', 
-                 (count, goal, user_id))
-    conn.commit()
-    conn.close()
-    logger.info(f"Steps updated for user {session['email']}: action={action}, count={count}, goal={goal}")
-    return jsonify({'count': count, 'goal': goal, 'last_updated': timestamp})
+    def generate():
+        for first in range(0, len(users), BATCH_CHUNK_USERS):
+            lines = {}
+            valid = []
+            for index in range(first, min(first + BATCH_CHUNK_USERS, len(users))):
+                try:
+                    valid.append((index, parse(users[index])))
+                except (ValueError, TypeError, AttributeError) as e:
+                    lines[index] = {'index': index, 'error': str(e)}
+            try:
+                plans = recommend_batch([user_input for _, user_input in valid])
+            except Exception as e:
+                logger.error(f"Batch {kind} recommendation error: {str(e)}")
+                plans = [None] * len(valid)
+            for (index, _), plan in zip(valid, plans):
+                if plan is None:
+                    lines[index] = {'index': index, 'error': f'No suitable {kind} plan found.'}
+                elif kind == 'workout':
+                    lines[index] = {'index': index, 'recommendation': {
+                        'workout_type': plan['Workout_Type'],
+                        'exercises': plan['Exercises'],
+                        'duration': plan['Duration']
+                    }}
+                else:
+                    lines[index] = {'index': index, 'recommendation': plan}
+            for index in sorted(lines):
+                yield json.dumps(lines[index]) + '\n'
 
-@app.route('/api/update_sleep', methods=['POST'])
-def update_sleep():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    data = request.get_json()
-    action = data.get('action')
-    user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT sleep_duration, sleep_goal FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    duration = tracking['sleep_duration'] if tracking else 0
-    goal = tracking['sleep_goal'] if tracking else 8.0
-    timestamp = data.get('timestamp', datetime.now().isoformat())
-    try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Sleep update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    if action == 'set':
-        duration = float(data.get('duration', duration))
-        if duration < 0 or duration > 12:
-            logger.warning(f"Sleep update failed: Invalid duration {duration}")
-            return jsonify({'error': 'Sleep duration must be between 0 and 12 hours'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'sleep', duration, timestamp))
-    elif action == 'increase':
-        duration = min(duration + 0.1, 12)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'sleep', duration, timestamp))
-    elif action == 'decrease':
-        duration = max(duration - 0.1, 0)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'sleep', duration, timestamp))
-    elif action == 'set_goal':
-        goal = float(data.get('goal', goal))
-        goal = max(min(goal, 12), 4)
-    conn.execute('UPDATE user_data SET sleep_duration = ?, sleep_goal = ? WHERE user_id = ?', 
-                 (duration, goal, user_id))
-    conn.commit()
-    conn.close()
-    logger.info(f"Sleep updated for user {session['email']}: action={action}, duration={duration}, goal={goal}")
-    return jsonify({'duration': duration, 'goal': goal, 'last_updated': timestamp})
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-@app.route('/api/update_exercise', methods=['POST'])
-def update_exercise():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
-    data = request.get_json()
-    action = data.get('action', 'set')
-    user_id = session['user_id']
-    conn = get_db_connection()
-    tracking = conn.execute('SELECT exercise_hours FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    exercise_hours = tracking['exercise_hours'] if tracking else 0
-    timestamp = data.get('timestamp', datetime.now().isoformat())
-    try:
-        timestamp_dt = datetime.fromisoformat(timestamp)
-    except ValueError:
-        logger.warning(f"Exercise update failed: Invalid timestamp {timestamp}")
-        return jsonify({'error': 'Invalid timestamp format'}), 400
-    if action == 'set':
-        exercise_hours = float(data.get('value', exercise_hours))
-        if exercise_hours < 0 or exercise_hours > 24:
-            logger.warning(f"Exercise update failed: Invalid hours {exercise_hours}")
-            return jsonify({'error': 'Exercise hours must be between 0 and 24'}), 400
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'exercise', exercise_hours, timestamp))
-    elif action == 'increase':
-        exercise_hours = min(exercise_hours + 0.1, 24)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'exercise', exercise_hours, timestamp))
-    elif action == 'decrease':
-        exercise_hours = max(exercise_hours - 0.1, 0)
-        conn.execute('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', 
-                     (user_id, 'exercise', exercise_hours, timestamp))
-    conn.execute('UPDATE user_data SET exercise_hours = ? WHERE user_id = ?', (exercise_hours, user_id))
-    conn.commit()
-    conn.close()
-    logger.info(f"Exercise updated for user {session['email']}: action={action}, hours={exercise_hours}")
-    return jsonify({'exercise_hours': exercise_hours, 'last_updated': timestamp})
+def tracking_update_view(name):
+    metric = METRICS[name]
+    def view():
+        if 'user_id' not in session:
+            return jsonify({'error': 'Unauthorized'}), 401
+        try:
+            action, payload = tracking_engine.update(session['user_id'], name, request.get_json())
+        except TrackingError as e:
+            return jsonify({'error': str(e)}), 400
+        logger.info(f"{metric.label} updated for user {session['email']}: action={action}, {payload}")
+        return jsonify(payload)
+    return view
+
+for endpoint, metric in TRACKING_ENDPOINTS.items():
+    app.add_url_rule(metric.url, endpoint=endpoint, view_func=tracking_update_view(metric.name), methods=['POST'])
 
-@app.route('/api/todos', methods=['POST', 'PUT', 'DELETE'])
+@app.route('/api/todos', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def manage_todos():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     user_id = session['user_id']
-    conn = get_db_connection()
     today = datetime.now().strftime('%Y-%m-%d')
     
+    if request.method == 'GET':
+        try:
+            date = datetime.strptime(request.args.get('date') or today, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+        try:
+            after = parse_cursor(request.args.get('after'))
+            limit = parse_page_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        conn = get_db_connection()
+        todos, next_cursor = fetch_todos(conn, user_id, date, after, limit)
+        conn.close()
+        return jsonify({'todos': todos, 'next': next_cursor})
+    
+    conn = get_db_connection()
     if request.method == 'POST':
         data = request.get_json()
         task = data.get('task')
@@ -1326,11 +1222,21 @@ def manage_todos():
         logger.info(f"Todo deleted for user {session['email']}: id={todo_id}")
         return jsonify({'success': True})
 
-@app.route('/api/notifications', methods=['DELETE'])
+@app.route('/api/notifications', methods=['GET', 'DELETE'])
 def manage_notifications():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     user_id = session['user_id']
+    if request.method == 'GET':
+        try:
+            before = parse_cursor(request.args.get('before'))
+            limit = parse_page_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        conn = get_db_connection()
+        notifications, next_cursor = fetch_notifications(conn, user_id, before, limit)
+        conn.close()
+        return jsonify({'notifications': notifications, 'next': next_cursor})
     conn = get_db_connection()
     conn.execute('DELETE FROM notifications WHERE user_id = ?', (user_id,))
     conn.commit()
@@ -1343,15 +1249,16 @@ def get_tracking():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     user_id = session['user_id']
+    try:
+        limit = parse_history_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     conn = get_db_connection()
+    # Read fresh rather than through the profile cache: the trackers poll this right after their own updates.
     tracking = conn.execute('SELECT * FROM user_data WHERE user_id = ?', (user_id,)).fetchone()
-    history = {}
-    for t in ['weight', 'workout', 'steps', 'sleep', 'water', 'mood', 'exercise']:
-        rows = conn.execute('SELECT value, timestamp FROM tracking_history WHERE user_id = ? AND type = ? ORDER BY timestamp DESC LIMIT 7', 
-                           (user_id, t)).fetchall()
-        history[t] = [{'value': row['value'], 'timestamp': row['timestamp']} for row in rows]
-    conn.close()
     tracking_dict = get_user_data_dict(tracking, session['email'])
+    history = fetch_history(conn, user_id, TRACKING_TYPES, limit)
+    conn.close()
     return jsonify({
         'water': {
             'intake': float(tracking_dict['water_intake']),
@@ -1394,5 +1301,85 @@ def get_tracking():
         }
     })
 
+@app.route('/api/tracking/aggregate/<period>', methods=['GET'])
+def get_tracking_aggregate(period):
+    """Day, week or month aggregates of one tracking type, served from the daily rollups."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if period not in PERIODS:
+        return jsonify({'error': f"period must be one of {', '.join(PERIODS)}"}), 400
+    tracking_type = request.args.get('type')
+    if tracking_type not in TRACKING_TYPES:
+        return jsonify({'error': f"type must be one of {', '.join(TRACKING_TYPES)}"}), 400
+    try:
+        limit = parse_period_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conn = get_db_connection()
+    buckets = aggregate(conn, session['user_id'], tracking_type, period, limit)
+    conn.close()
+    return jsonify({'type': tracking_type, 'period': period, 'buckets': buckets})
+
+@app.route('/api/tracking/bulk', methods=['POST'])
+def tracking_bulk():
+    """Store a batch of readings (JSON array or NDJSON) from a device sync in one transaction."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        result = tracking_engine.ingest(session['user_id'], parse_readings(request.get_data(as_text=True)))
+    except TrackingError as e:
+        logger.warning(f"Bulk tracking sync failed for user {session['email']}: {e}")
+        return jsonify({'error': str(e)}), 400
+    logger.info(f"Bulk tracking sync for user {session['email']}: {result['inserted']} of {result['received']} readings stored")
+    return jsonify(result)
+
+@app.route('/api/tracking/export', methods=['GET'])
+def tracking_export():
+    """All of the user's tracking entries as NDJSON, archived ones included; ?type=a,b&from=&to= narrow it."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    types = request.args.get('type', '').split(',') if request.args.get('type') else TRACKING_TYPES
+    if any(tracking_type not in TRACKING_TYPES for tracking_type in types):
+        return jsonify({'error': f"type must be one of {', '.join(TRACKING_TYPES)}"}), 400
+    try:
+        start, end = (to_epoch_ms(request.args[key]) if request.args.get(key) else None for key in ('from', 'to'))
+    except ValueError:
+        return jsonify({'error': 'Invalid timestamp format'}), 400
+    user_id = session['user_id']
+
+    def generate():
+        conn = get_db_connection()
+        try:
+            for entry in export_history(conn, user_id, types, start, end):
+                yield json.dumps(entry) + '\n'
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def admin_authorized():
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+@app.route('/admin/reload_recommenders', methods=['POST'])
+def admin_reload_recommenders():
+    """Rebuild the recommenders in the background; requests keep the current version until the swap."""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    names = [data['type']] if data.get('type') else ['diet', 'workout']
+    if any(name not in ['diet', 'workout'] for name in names):
+        return jsonify({'error': 'type must be diet or workout'}), 400
+    started = [name for name in names if recommenders.reload(name)]
+    logger.info(f"Recommender reload requested for {names}, started {started}")
+    return jsonify({'started': started, 'status': recommenders.status()}), 202
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'recommenders': recommenders.status(), 'db_pool': db_pool.stats(),
+                    'profile_cache': profile_cache.stats(), 'password_hasher': password_hasher.stats(),
+                    **metrics.snapshot()})
+
 if __name__ == '__main__':
     app.run(debug=True)
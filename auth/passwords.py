@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import bcrypt
+from monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Work factors calibrate_rounds may pick. The floor is bcrypt.gensalt's default, which
+# hashes made before calibration used: a slow CPU must not weaken new hashes below it.
+MIN_ROUNDS = 12
+MAX_ROUNDS = 20
+
+
+def hash_seconds(rounds: int, repeat: int = 3) -> float:
+    """Fastest of `repeat` bcrypt hashes at `rounds` on this CPU."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_rounds(target_seconds: float = 0.5, min_rounds: int = MIN_ROUNDS, max_rounds: int = MAX_ROUNDS) -> int:
+    """Largest bcrypt work factor whose hash takes at most `target_seconds` here, at least `min_rounds`.
+
+    Each extra round doubles the hash time, so a cost is only measured when the one
+    below took at most half the target, and calibrating takes a few times the target.
+    The floor is hashed once: when that alone exceeds the target there is nothing to pick.
+    """
+    start = time.perf_counter()
+    rounds = min_rounds
+    elapsed = hash_seconds(rounds, repeat=1)
+    if elapsed > target_seconds:
+        logger.warning(f"bcrypt work factor {rounds} takes {elapsed * 1000:.0f} ms per hash, over the "
+                       f"{target_seconds * 1000:.0f} ms target; using it anyway")
+        return rounds
+    while rounds < max_rounds and elapsed * 2 <= target_seconds:
+        measured = hash_seconds(rounds + 1)
+        if measured > target_seconds:
+            break
+        rounds, elapsed = rounds + 1, measured
+    logger.info(f"bcrypt work factor {rounds} ({elapsed * 1000:.0f} ms per hash) for a "
+                f"{target_seconds * 1000:.0f} ms target, calibrated in {time.perf_counter() - start:.1f}s")
+    return rounds
+
+
+def hash_rounds(password_hash) -> Optional[int]:
+    """Work factor of a stored bcrypt hash ($2b$12$...), None if it is not one."""
+    if isinstance(password_hash, str):
+        password_hash = password_hash.encode('utf-8')
+    try:
+        return int(password_hash.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class HasherBusy(Exception):
+    """Raised instead of queueing when the password hasher already has `max_queue` requests waiting."""
+
+
+class PasswordHasher:
+    """Runs bcrypt hashes and checks on a small thread pool, away from the request threads.
+
+    bcrypt releases the GIL while it hashes, so `workers` threads use up to that many
+    cores and a login burst cannot take every CPU from the other endpoints. The
+    calling request thread waits for its result without using CPU. At most
+    `max_queue` calls wait for a worker; further ones raise HasherBusy at once, so
+    the caller can answer 503 instead of piling up requests behind the pool.
+    `rounds` is the bcrypt work factor of new hashes.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 32, rounds: int = 12):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def hash(self, password: bytes) -> bytes:
+        return self.run('hash', lambda: bcrypt.hashpw(password, bcrypt.gensalt(self.rounds)))
+
+    def needs_rehash(self, password_hash) -> bool:
+        """Whether a stored hash was made with a lower work factor than new hashes get.
+
+        Stronger hashes are kept: a worker that calibrated lower must not weaken them.
+        """
+        rounds = hash_rounds(password_hash)
+        return rounds is not None and rounds < self.rounds
+
+    def check(self, password: bytes, password_hash) -> bool:
+        if isinstance(password_hash, str):
+            password_hash = password_hash.encode('utf-8')
+        return self.run('check', lambda: bcrypt.checkpw(password, password_hash))
+
+    def run(self, kind: str, work: Callable):
+        with self.lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                metrics.incr('password_hasher.rejected')
+                raise HasherBusy()
+            self.in_flight += 1
+            metrics.set_gauge('password_hasher.in_flight', self.in_flight)
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            metrics.observe('password_hasher.wait_seconds', started - submitted)
+            try:
+                return work()
+            finally:
+                metrics.observe(f'password_hasher.{kind}_seconds', time.perf_counter() - started)
+
+        try:
+            return self.executor.submit(task).result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                metrics.set_gauge('password_hasher.in_flight', self.in_flight)
+
+    def stats(self):
+        return {'workers': self.workers, 'max_queue': self.max_queue, 'rounds': self.rounds, 'in_flight': self.in_flight}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,56 @@
+"""bcrypt throughput per work factor, to choose BCRYPT_ROUNDS and BCRYPT_WORKERS.
+
+For each cost, times single-threaded hashes (hashes per second per core) and then
+hashes from one thread per core (bcrypt releases the GIL, as the app's
+PasswordHasher relies on). Also reports the cost `calibrate_rounds` picks for the
+target, the one the app uses when BCRYPT_ROUNDS is unset.
+
+Usage: python benchmarks/bench_bcrypt.py [min cost] [max cost] [target ms]   (default: 10 14 500)
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth.passwords import calibrate_rounds
+
+PASSWORD = b'correct horse battery staple'
+MIN_SECONDS = 1.0
+
+
+def hashes_per_second(rounds, threads):
+    """Hashes per second with `threads` threads hashing for about MIN_SECONDS."""
+    def worker(deadline):
+        count = 0
+        while time.perf_counter() < deadline:
+            bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds))
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        counts = list(executor.map(worker, [start + MIN_SECONDS] * threads))
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def run(min_cost, max_cost, target_ms):
+    cores = os.cpu_count() or 1
+    chosen = calibrate_rounds(target_ms / 1000)
+    print(f"{cores} cores; calibrate_rounds picks cost {chosen} for a {target_ms:.0f} ms target")
+    print(f"  cost  ms/hash  hashes/s/core  hashes/s ({cores} threads)")
+    for rounds in range(min_cost, max_cost + 1):
+        single = hashes_per_second(rounds, 1)
+        parallel = hashes_per_second(rounds, cores)
+        marker = '  <- calibrated' if rounds == chosen else ''
+        print(f"  {rounds:4d}  {1000 / single:7.1f}  {single:13.1f}  {parallel:8.1f}{marker}")
+
+
+if __name__ == '__main__':
+    min_cost = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    max_cost = int(sys.argv[2]) if len(sys.argv) > 2 else 14
+    target_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 500
+    run(min_cost, max_cost, target_ms)
@@ -0,0 +1,79 @@
+"""Per-request cost of building the diet meal plan payload, before and after prebuilding.
+
+"row" builds the payload from `self.data.iloc[position]` on every request (the old
+`meal_plan`); "prebuilt" picks the payload materialized at load time. Allocations
+are measured with tracemalloc over a batch of requests and reported per request.
+
+Usage: python benchmarks/bench_diet_meal_plans.py [rows ...]   (default: 1000 100000)
+"""
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import diet_frame, write_csv
+from recommendation.diet_recommendation import DietRecommendationSystem
+from recommendation.dataset_store import build_store
+
+REQUESTS = 1000
+
+
+def same_plan(a, b):
+    """Payload equality that treats the NaN meal of an empty Post-Dinner as equal to itself."""
+    if a.keys() != b.keys() or a['Total Calories'] != b['Total Calories']:
+        return False
+    for slot in a:
+        if slot == 'Total Calories':
+            continue
+        meal_a, meal_b = a[slot]['Meal'], b[slot]['Meal']
+        nan_a = isinstance(meal_a, float) and math.isnan(meal_a)
+        nan_b = isinstance(meal_b, float) and math.isnan(meal_b)
+        if nan_a != nan_b or (not nan_a and meal_a != meal_b) or a[slot]['Calories'] != b[slot]['Calories']:
+            return False
+    return True
+
+
+def measure(fn, positions):
+    start = time.perf_counter()
+    for position in positions:
+        fn(position)
+    seconds = (time.perf_counter() - start) / len(positions)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [fn(position) for position in positions]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    del results
+    return seconds, allocated / len(positions), blocks / len(positions)
+
+
+def run(rows, store):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_csv(diet_frame(rows), tmp, 'diet_dataset.csv')
+        if store:
+            build_store(path)
+        start = time.perf_counter()
+        system = DietRecommendationSystem(path)
+        load = time.perf_counter() - start
+        positions = list(range(0, rows, max(1, rows // REQUESTS)))[:REQUESTS]
+        for position in positions:
+            assert same_plan(system.meal_plan(position), system.meal_plan_from_row(system.data.iloc[position])), position
+        row = measure(lambda p: system.meal_plan_from_row(system.data.iloc[p]), positions)
+        prebuilt = measure(system.meal_plan, positions)
+        label = 'store' if store else 'csv'
+        print(f"{rows:>8} rows ({label:>5})  load {load:6.2f}s  {len(system.meal_plans)} plans")
+        for name, (seconds, size, blocks) in (('row', row), ('prebuilt', prebuilt)):
+            print(f"    {name:>8}  {seconds * 1e6:9.2f} us/request  {size:9.0f} B/request  {blocks:6.1f} blocks/request")
+
+
+if __name__ == '__main__':
+    for rows in [int(arg) for arg in sys.argv[1:]] or [1000, 100000]:
+        for store in (False, True):
+            run(rows, store)
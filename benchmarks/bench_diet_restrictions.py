@@ -0,0 +1,54 @@
+"""Compare the `str.contains` restriction filter with DietRecommendationSystem's inverted index.
+
+Usage: python benchmarks/bench_diet_restrictions.py [rows]   (default: 100000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import diet_frame, write_csv
+from recommendation.diet_recommendation import DietRecommendationSystem
+
+CASES = [
+    ('None', 'None'),
+    ('Nuts', 'None'),
+    ('Nuts, Dairy, Gluten', 'Diabetes'),
+    ('Nuts, Dairy, Gluten, Soy, Shellfish', 'Diabetes, Hypertension'),
+]
+
+
+def contains_filter(df, allergies, medical_conditions):
+    """The filter as it was before the index: one DataFrame copy and scan per term."""
+    filtered_df = df.copy()
+    if allergies and allergies.lower() != 'none':
+        for allergy in allergies.split(','):
+            filtered_df = filtered_df[~filtered_df['Allergies'].str.contains(allergy.strip(), case=False, na=False)]
+    if medical_conditions and medical_conditions.lower() != 'none':
+        for condition in medical_conditions.split(','):
+            filtered_df = filtered_df[
+                filtered_df['Medical_Conditions'].str.contains(condition.strip(), case=False, na=False) |
+                (filtered_df['Medical_Conditions'] == 'None')
+            ]
+    return filtered_df
+
+
+def per_call(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        system = DietRecommendationSystem(write_csv(diet_frame(rows), tmp, 'diet_dataset.csv'))
+    for allergies, conditions in CASES:
+        contains_ms, expected = per_call(lambda: contains_filter(system.data, allergies, conditions))
+        index_ms, mask = per_call(lambda: system.restriction_mask(allergies, conditions))
+        assert system.data.index[mask].equals(expected.index), f"filters differ for {allergies!r} / {conditions!r}"
+        print(f"{rows} rows  allergies={allergies!r:40} conditions={conditions!r:28} "
+              f"str.contains {contains_ms:8.2f} ms  index {index_ms:6.3f} ms")
@@ -0,0 +1,44 @@
+"""Compare the row-wise `apply` scorer with the vectorized kernel in DietRecommendationSystem.
+
+Usage: python benchmarks/bench_diet_scoring.py [rows ...]   (default: 1000 100000 1000000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import diet_frame, diet_inputs, write_csv
+from recommendation.diet_recommendation import DietRecommendationSystem
+from recommendation.scoring import best_position
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        system = DietRecommendationSystem(write_csv(diet_frame(rows), tmp, 'diet_dataset.csv'))
+    user_input = system.normalize_input(diet_inputs(1)[0])
+    apply_repeat = 3 if rows <= 100_000 else 1
+    apply_time, apply_best = timed(
+        lambda: system.data.apply(lambda row: system.calculate_similarity(user_input, row), axis=1).idxmax(),
+        apply_repeat
+    )
+    kernel_time, kernel_best = timed(lambda: best_position(system.kernel.score(user_input)), 10)
+    assert apply_best == kernel_best, f"best match differs: apply={apply_best} kernel={kernel_best}"
+    print(f"{rows:>9} rows  apply {apply_time * 1000:10.2f} ms  kernel {kernel_time * 1000:8.3f} ms  "
+          f"speedup {apply_time / kernel_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,126 @@
+"""Size and scan speed of tracking_history before and after the typed storage migration.
+
+Fills a scratch database with legacy rows (TEXT values, ISO text timestamps, as
+init_db created them), indexes it, then migrates it in place with `ensure_history`.
+Both layouts are measured after a VACUUM: file size, and the time of a full-table
+aggregate of one metric and of a range scan over (up to) a month in the middle of
+the data, whose results must match.
+
+Usage: python benchmarks/bench_history_storage.py [rows] [users]   (default: 5000000 10000)
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.schema import create_history_index
+from tracking.history import TRACKING_TYPES, ensure_history
+from tracking.registry import METRICS
+
+LEGACY_TABLE = '''
+    CREATE TABLE tracking_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        value TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+START = datetime(2024, 1, 1)
+# Seconds between consecutive synthetic entries.
+SPACING = 7
+SCANS = {
+    'legacy': {
+        'aggregate': "SELECT COUNT(*), SUM(CAST(value AS REAL)), MIN(timestamp), MAX(timestamp) FROM tracking_history WHERE type = 'steps'",
+        'range': "SELECT COUNT(*), coalesce(SUM(CAST(value AS REAL)), 0) FROM tracking_history WHERE type != 'mood' AND timestamp >= ? AND timestamp < ?",
+    },
+    'typed': {
+        'aggregate': "SELECT COUNT(*), SUM(value), MIN(timestamp), MAX(timestamp) FROM tracking_history WHERE type = 'steps'",
+        'range': "SELECT COUNT(*), coalesce(SUM(value), 0) FROM tracking_history WHERE type != 'mood' AND timestamp >= ? AND timestamp < ?",
+    },
+}
+
+
+def populate(conn, rows, users, batch=200_000):
+    conn.execute(LEGACY_TABLE)
+    rng = random.Random(0)
+    for first in range(0, rows, batch):
+        entries = []
+        for i in range(first, min(first + batch, rows)):
+            tracking_type = rng.choice(TRACKING_TYPES)
+            choices = METRICS[tracking_type].choices
+            value = rng.choice(choices) if choices else str(round(rng.uniform(0, 100), 1))
+            moment = START + timedelta(seconds=i * SPACING, microseconds=rng.randrange(1_000_000))
+            entries.append((rng.randrange(1, users + 1), tracking_type, value, moment.isoformat()))
+        conn.executemany('INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)', entries)
+        conn.commit()
+
+
+def scan_window(rows):
+    """A month in the middle of the populated timestamps, or their middle third when they span less."""
+    span = timedelta(seconds=rows * SPACING)
+    length = min(timedelta(days=30), span / 3)
+    start = START + (span - length) / 2
+    return start, start + length
+
+
+def size_mb(conn):
+    conn.execute('VACUUM')
+    pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    return pages * conn.execute('PRAGMA page_size').fetchone()[0] / 1e6
+
+
+def timed(conn, sql, params=(), repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure(conn, layout, rows):
+    size = size_mb(conn)
+    window = scan_window(rows)
+    bounds = [moment.isoformat() for moment in window] if layout == 'legacy' else [int(moment.timestamp() * 1000) for moment in window]
+    aggregate_seconds, aggregate = timed(conn, SCANS[layout]['aggregate'])
+    range_seconds, range_totals = timed(conn, SCANS[layout]['range'], bounds)
+    print(f"  {layout:>6}  {size:9.1f} MB  {size * 1e6 / rows:6.1f} B/row  "
+          f"full aggregate {aggregate_seconds * 1000:8.1f} ms  range scan {range_seconds * 1000:8.1f} ms")
+    return size, aggregate_seconds, range_seconds, aggregate, range_totals
+
+
+def run(rows, users):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        start = time.perf_counter()
+        populate(conn, rows, users)
+        create_history_index(conn)
+        conn.commit()
+        print(f"{rows} legacy rows for {users} users populated in {time.perf_counter() - start:.1f}s")
+        legacy = measure(conn, 'legacy', rows)
+        start = time.perf_counter()
+        ensure_history(conn)
+        create_history_index(conn)
+        conn.commit()
+        print(f"  migrated and reindexed in {time.perf_counter() - start:.1f}s")
+        typed = measure(conn, 'typed', rows)
+        for before, after in [(legacy[3][0], typed[3][0]), (legacy[4][0], typed[4][0])]:
+            assert before[0] == after[0] and abs(before[1] - after[1]) <= 1e-9 * abs(before[1]), (before, after)
+        print(f"  size {typed[0] / legacy[0]:.2f}x, full aggregate {legacy[1] / typed[1]:.1f}x faster, "
+              f"range scan {legacy[2] / typed[2]:.1f}x faster")
+        conn.close()
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    run(rows, users)
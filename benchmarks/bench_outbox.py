@@ -0,0 +1,193 @@
+"""Throughput and failure handling of the mail outbox, against a fake SMTP server.
+
+Queues messages in a scratch database and drives an OutboxWorker's `drain` directly
+(its thread only wakes on `wake()`), over a fake connection that records what it
+sends and fails on demand. Measures sending a backlog, then checks each failure
+path against the table: a refused recipient is retried alone, a connection dropped
+mid-batch fails one message and releases the rest without an attempt, an
+unreachable server backs every claimed message off with doubling delays until it
+is given up on, and a second worker skips messages claimed by the first.
+
+Usage: python benchmarks/bench_outbox.py [messages] [batch size]   (default: 5000 50)
+"""
+import os
+import smtplib
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.pool import ConnectionPool
+from mailer.outbox import OutboxWorker, enqueue, ensure_outbox, now_ms
+from monitoring.metrics import metrics
+
+BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 300
+MAX_ATTEMPTS = 5
+
+
+class FakeServer:
+    """Stands in for the SMTP server: `refused` recipients are rejected one by one,
+    the connection drops after `drop_after` sends, and `unreachable` fails to connect."""
+
+    def __init__(self):
+        self.sent = []
+        self.connections = 0
+        self.refused = set()
+        self.drop_after = None
+        self.unreachable = False
+
+    @contextmanager
+    def open_connection(self):
+        if self.unreachable:
+            raise ConnectionRefusedError('fake server unreachable')
+        self.connections += 1
+        yield self
+
+    def send(self, message):
+        recipient = message.recipients[0]
+        if recipient in self.refused:
+            raise smtplib.SMTPRecipientsRefused({recipient: (550, b'no such user')})
+        if self.drop_after is not None and len(self.sent) >= self.drop_after:
+            raise smtplib.SMTPServerDisconnected('fake server dropped the connection')
+        self.sent.append(recipient)
+
+
+def outbox_rows(conn):
+    return {row['recipient']: row for row in conn.execute('SELECT * FROM outbox')}
+
+
+def make_due(conn):
+    """Move every pending retry to now instead of waiting out its backoff."""
+    conn.execute('UPDATE outbox SET next_attempt = ? WHERE next_attempt IS NOT NULL', (now_ms(),))
+    conn.commit()
+
+
+def queue(conn, recipients):
+    for recipient in recipients:
+        enqueue(conn, recipient, 'Password Reset Request', f'Reset link for {recipient}')
+    conn.commit()
+
+
+def throughput(conn, worker, server, messages):
+    queue(conn, [f'user{i}@example.com' for i in range(messages)])
+    start = time.perf_counter()
+    sent = worker.drain()
+    elapsed = time.perf_counter() - start
+    assert sent == messages == len(server.sent), (sent, len(server.sent))
+    assert server.connections == 1 and not outbox_rows(conn)
+    print(f"  backlog: {messages} messages sent over {server.connections} connection in {elapsed:.2f}s "
+          f"({messages / elapsed:.0f} messages/s, batches of {worker.batch_size})")
+
+
+def refused_recipient(conn, worker, server):
+    server.sent.clear()
+    server.refused = {'bounce@example.com'}
+    queue(conn, ['a@example.com', 'bounce@example.com', 'b@example.com'])
+    before = now_ms()
+    assert worker.drain() == 2
+    row = outbox_rows(conn)['bounce@example.com']
+    delay = (row['next_attempt'] - before) / 1000
+    assert row['attempts'] == 1 and 'no such user' in row['last_error']
+    assert BACKOFF_SECONDS <= delay < BACKOFF_SECONDS + 5, delay
+    assert server.sent == ['a@example.com', 'b@example.com']
+    print(f"  refused recipient: the other 2 sent, retry in {delay:.0f}s")
+    server.refused = set()
+    make_due(conn)
+    assert worker.drain() == 1 and not outbox_rows(conn)
+
+
+def dropped_connection(conn, worker, server):
+    server.sent.clear()
+    server.drop_after = 2
+    queue(conn, [f'drop{i}@example.com' for i in range(5)])
+    try:
+        worker.drain()
+    except smtplib.SMTPServerDisconnected:
+        pass
+    else:
+        raise AssertionError('drain should re-raise the dropped connection')
+    rows = outbox_rows(conn)
+    attempts = sorted(row['attempts'] for row in rows.values())
+    assert len(server.sent) == 2 and attempts == [0, 0, 1], attempts
+    released = [row for row in rows.values() if row['attempts'] == 0]
+    assert all(row['next_attempt'] <= now_ms() for row in released)
+    print(f"  dropped connection: 2 sent, 1 failed, {len(released)} released without an attempt")
+    server.drop_after = None
+    assert worker.drain() == 2
+    make_due(conn)
+    assert worker.drain() == 1 and not outbox_rows(conn)
+
+
+def unreachable_server(conn, worker, server):
+    server.unreachable = True
+    queue(conn, ['retry@example.com'])
+    delays = []
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        before = now_ms()
+        try:
+            worker.drain()
+        except ConnectionRefusedError:
+            pass
+        row = outbox_rows(conn)['retry@example.com']
+        assert row['attempts'] == attempt, (row['attempts'], attempt)
+        if row['next_attempt'] is None:
+            break
+        delays.append(round((row['next_attempt'] - before) / 1000))
+        make_due(conn)
+    expected = [min(BACKOFF_SECONDS * 2 ** n, MAX_BACKOFF_SECONDS) for n in range(MAX_ATTEMPTS - 1)]
+    assert row['next_attempt'] is None and delays == expected, (delays, expected)
+    print(f"  unreachable server: retries after {', '.join(f'{delay}s' for delay in delays)}, "
+          f"given up after {row['attempts']} attempts")
+    server.unreachable = False
+    assert worker.drain() == 0
+    conn.execute('DELETE FROM outbox')
+    conn.commit()
+
+
+def concurrent_claim(pool, conn, worker, server):
+    other = OutboxWorker(pool.acquire, server.open_connection, 'noreply@example.com', poll_seconds=3600,
+                         batch_size=worker.batch_size)
+    try:
+        queue(conn, [f'lease{i}@example.com' for i in range(worker.batch_size + 3)])
+        claimed = worker.claim()
+        assert len(claimed) == worker.batch_size
+        assert len(other.claim()) == 3
+        assert other.claim() == []
+        print(f"  two workers: {len(claimed)} and 3 messages claimed, none twice")
+    finally:
+        other.close()
+    conn.execute('DELETE FROM outbox')
+    conn.commit()
+
+
+def run(messages, batch_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'bench.db'))
+        conn = pool.connect()
+        ensure_outbox(conn)
+        conn.commit()
+        server = FakeServer()
+        worker = OutboxWorker(pool.acquire, server.open_connection, 'noreply@example.com', poll_seconds=3600,
+                              batch_size=batch_size, max_attempts=MAX_ATTEMPTS, backoff_seconds=BACKOFF_SECONDS,
+                              max_backoff_seconds=MAX_BACKOFF_SECONDS)
+        try:
+            throughput(conn, worker, server, messages)
+            refused_recipient(conn, worker, server)
+            dropped_connection(conn, worker, server)
+            unreachable_server(conn, worker, server)
+            concurrent_claim(pool, conn, worker, server)
+        finally:
+            worker.close()
+            conn.close()
+        counters = metrics.snapshot()['counters']
+        print('  ' + ', '.join(f"{name} {counters.get(name, 0)}"
+                               for name in ['outbox.sent', 'outbox.retries', 'outbox.given_up']))
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run(messages, batch_size)
@@ -0,0 +1,132 @@
+"""Latency of the tracking history reads behind /api/get_tracking and /progress.
+
+Fills a scratch database with synthetic tracking_history rows, then times each
+endpoint's history reads for random users: one query per metric on the bare table,
+the same after the app's history indexes, then the single statements: the UNION ALL of
+`fetch_history` and a ROW_NUMBER() window (both checked to return the same entries).
+Without the index every query scans the whole table, so fewer requests are sampled before.
+
+Usage: python benchmarks/bench_tracking_history.py [rows] [users]   (default: 10000000 10000)
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.schema import create_history_covering_index, create_history_index
+from tracking.history import ensure_history, fetch_history, from_epoch_ms
+from tracking.registry import METRICS
+
+TRACKING_TYPES = ['weight', 'workout', 'steps', 'sleep', 'water', 'mood', 'exercise']
+ENDPOINT_TYPES = {
+    'get_tracking': TRACKING_TYPES,
+    'progress': ['weight', 'water', 'steps', 'workout', 'sleep', 'mood'],
+}
+HISTORY_QUERY = 'SELECT value, timestamp FROM tracking_history WHERE user_id = ? AND type = ? ORDER BY timestamp DESC LIMIT 7'
+
+
+def random_entry(rng, users, timestamp):
+    tracking_type = rng.choice(TRACKING_TYPES)
+    metric = METRICS[tracking_type]
+    value = rng.choice(metric.choices) if metric.choices else round(rng.uniform(0, 100), 1)
+    return rng.randrange(1, users + 1), tracking_type, metric.encode(value), timestamp
+
+
+def populate(conn, rows, users, batch=200_000):
+    ensure_history(conn)
+    rng = random.Random(0)
+    start = int(datetime(2024, 1, 1).timestamp() * 1000)
+    for first in range(0, rows, batch):
+        conn.executemany(
+            'INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)',
+            (random_entry(rng, users, start + (first + i) * 7000) for i in range(min(batch, rows - first)))
+        )
+        conn.commit()
+
+
+def query_plan(conn):
+    return ' / '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + HISTORY_QUERY, (1, 'water')))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def per_metric_history(conn, user_id, types):
+    """The reads as the endpoints issued them before `fetch_history`: one query per metric."""
+    return {
+        tracking_type: [{'value': METRICS[tracking_type].decode(value), 'timestamp': from_epoch_ms(timestamp)}
+                        for value, timestamp in conn.execute(HISTORY_QUERY, (user_id, tracking_type))]
+        for tracking_type in types
+    }
+
+
+def windowed_history(conn, user_id, types, limit=7):
+    """All metrics in one ROW_NUMBER() query; it numbers every entry of the user's history."""
+    history = {tracking_type: [] for tracking_type in types}
+    rows = conn.execute(f'''
+        SELECT type, value, timestamp FROM (
+            SELECT type, value, timestamp,
+                   ROW_NUMBER() OVER (PARTITION BY type ORDER BY timestamp DESC) AS position
+            FROM tracking_history
+            WHERE user_id = ? AND type IN ({', '.join('?' for _ in types)})
+        )
+        WHERE position <= ?
+        ORDER BY type, position
+    ''', (user_id, *types, limit))
+    for tracking_type, value, timestamp in rows:
+        history[tracking_type].append({'value': METRICS[tracking_type].decode(value), 'timestamp': from_epoch_ms(timestamp)})
+    return history
+
+
+def measure(conn, users, requests, read=per_metric_history):
+    rng = random.Random(1)
+    for endpoint, types in ENDPOINT_TYPES.items():
+        samples = []
+        for _ in range(requests):
+            user_id = rng.randrange(1, users + 1)
+            start = time.perf_counter()
+            read(conn, user_id, types)
+            samples.append(time.perf_counter() - start)
+        p50, p99 = percentiles(samples)
+        print(f"    {endpoint:>12}  p50 {p50 * 1000:9.3f} ms  p99 {p99 * 1000:9.3f} ms  ({requests} requests)")
+
+
+def run(rows, users):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        start = time.perf_counter()
+        populate(conn, rows, users)
+        print(f"{rows} rows for {users} users populated in {time.perf_counter() - start:.1f}s")
+        print(f"  query plan: {query_plan(conn)}")
+        measure(conn, users, 20)
+        start = time.perf_counter()
+        create_history_index(conn)
+        create_history_covering_index(conn)
+        conn.commit()
+        print(f"  indexes built in {time.perf_counter() - start:.1f}s")
+        print(f"  query plan: {query_plan(conn)}")
+        measure(conn, users, 2000)
+        for user_id in range(1, min(users, 200) + 1):
+            expected = per_metric_history(conn, user_id, TRACKING_TYPES)
+            assert fetch_history(conn, user_id) == expected, user_id
+            assert windowed_history(conn, user_id, TRACKING_TYPES) == expected, user_id
+        print("  one UNION ALL query (fetch_history):")
+        measure(conn, users, 2000, fetch_history)
+        print("  one ROW_NUMBER() query:")
+        measure(conn, users, 2000, windowed_history)
+        conn.close()
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    run(rows, users)
@@ -0,0 +1,43 @@
+"""Timing of the vectorized WorkoutRecommendationSystem scorer against the row-wise one.
+
+Picks the best row for one input with `calculate_similarity` through
+`DataFrame.apply` and with `self.kernel`. Their parity, edge cases included, is
+covered by tests/test_workout_scoring.py.
+
+Usage: python benchmarks/bench_workout_scoring.py [rows ...]   (default: 1000 100000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import workout_frame, workout_inputs, write_csv
+from recommendation.workout_recommendation import WorkoutRecommendationSystem
+from recommendation.scoring import best_position
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        frame = workout_frame(rows)
+        frame.loc[0, 'Gender'] = np.nan
+        frame.loc[1, 'Age'] = np.nan
+        system = WorkoutRecommendationSystem(write_csv(frame, tmp, 'workout_dataset.csv'))
+    user_input = system.normalize_input(workout_inputs(1)[0])
+    start = time.perf_counter()
+    system.data.apply(lambda row: system.calculate_similarity(user_input, row), axis=1).idxmax()
+    apply_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(10):
+        best_position(system.kernel.score(user_input))
+    kernel_time = (time.perf_counter() - start) / 10
+    print(f"{rows:>9} rows  apply {apply_time * 1000:10.2f} ms  kernel {kernel_time * 1000:8.3f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000]
+    for size in sizes:
+        run(size)
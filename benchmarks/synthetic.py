@@ -0,0 +1,81 @@
+"""Synthetic datasets shaped like static/datasets/*.csv, used by the benchmarks."""
+import numpy as np
+import pandas as pd
+
+GENDERS = ['Male', 'Female']
+DIET_GOALS = ['Lose Weight', 'Gain Muscle', 'Maintain Weight']
+DIET_TYPES = ['Vegan', 'Vegetarian', 'Non-Vegetarian', 'Eggetarian']
+ACTIVITY_LEVELS = ['Sedentary', 'Lightly Active', 'Moderately Active', 'Very Active', 'Super Active']
+ALLERGIES = ['None', 'Nuts', 'Dairy', 'Gluten', 'Soy', 'Nuts, Dairy', 'Gluten, Soy', 'Shellfish']
+MEDICAL_CONDITIONS = ['None', 'Diabetes', 'Hypertension', 'Thyroid', 'Diabetes, Hypertension', 'PCOS']
+MEALS = ['Breakfast', 'Mid-Morning', 'Lunch', 'Evening_Snack', 'Dinner', 'Post-Dinner']
+
+FITNESS_LEVELS = ['Beginner', 'Intermediate', 'Advanced']
+WORKOUT_GOALS = ['Strength', 'Endurance', 'Flexibility', 'Weight Loss']
+WORKOUT_PREFERENCES = ['Home', 'Gym', 'Outdoor']
+WORKOUT_TYPES = ['Full Body', 'Upper Body', 'Lower Body', 'Cardio', 'Yoga', 'HIIT']
+EXERCISES = ['Push-ups', 'Squats', 'Lunges', 'Plank', 'Burpees', 'Deadlifts', 'Rows', 'Running', 'Stretching']
+
+
+def diet_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {
+        'Age': rng.integers(18, 70, rows),
+        'Gender': rng.choice(GENDERS, rows),
+        'Goal': rng.choice(DIET_GOALS, rows),
+        'Diet_Type': rng.choice(DIET_TYPES, rows),
+        'Allergies': rng.choice(ALLERGIES, rows),
+        'Medical_Conditions': rng.choice(MEDICAL_CONDITIONS, rows),
+        'Activity_Level': rng.choice(ACTIVITY_LEVELS, rows),
+    }
+    for meal in MEALS:
+        data[f'Recommended_{meal}'] = np.char.add(f'{meal} option ', rng.integers(0, 50, rows).astype(str))
+        data[f'{meal}_Calories'] = rng.integers(50, 700, rows)
+    frame = pd.DataFrame(data)
+    frame.loc[rng.random(rows) < 0.2, 'Recommended_Post-Dinner'] = np.nan
+    return frame
+
+
+def diet_inputs(count: int, seed: int = 1) -> list:
+    rng = np.random.default_rng(seed)
+    return [{
+        'Age': int(rng.integers(18, 70)),
+        'Gender': str(rng.choice(GENDERS)),
+        'Goal': str(rng.choice(DIET_GOALS)),
+        'Diet_Type': str(rng.choice(DIET_TYPES)),
+        'Allergies': str(rng.choice(['None', 'Nuts', 'Dairy, Gluten'])),
+        'Medical_Conditions': str(rng.choice(['None', 'Diabetes'])),
+        'Activity_Level': str(rng.choice(ACTIVITY_LEVELS)),
+    } for _ in range(count)]
+
+
+def workout_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Age': rng.integers(18, 70, rows),
+        'Gender': rng.choice(GENDERS, rows),
+        'Fitness_Level': rng.choice(FITNESS_LEVELS, rows),
+        'Goal': rng.choice(WORKOUT_GOALS, rows),
+        'Workout_Time_per_day_mins': rng.choice([15, 20, 30, 45, 60, 90, 120], rows),
+        'Workout_Preference': rng.choice(WORKOUT_PREFERENCES, rows),
+        'Recommended_Workout': rng.choice(WORKOUT_TYPES, rows),
+        'Workout_Exercises': [', '.join(rng.choice(EXERCISES, 3, replace=False)) for _ in range(rows)],
+    })
+
+
+def workout_inputs(count: int, seed: int = 1) -> list:
+    rng = np.random.default_rng(seed)
+    return [{
+        'Age': int(rng.integers(18, 70)),
+        'Gender': str(rng.choice(GENDERS)),
+        'Fitness_Level': str(rng.choice(FITNESS_LEVELS)),
+        'Goal': str(rng.choice(WORKOUT_GOALS)),
+        'Workout_Preference': str(rng.choice(WORKOUT_PREFERENCES)),
+        'Workout_Time_per_day_mins': int(rng.integers(10, 241)),
+    } for _ in range(count)]
+
+
+def write_csv(frame: pd.DataFrame, directory: str, name: str) -> str:
+    path = f'{directory}/{name}'
+    frame.to_csv(path, index=False)
+    return path
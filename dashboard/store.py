@@ -0,0 +1,88 @@
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+from monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+CLEANUP_WINDOW = 5000
+
+
+def parse_page_limit(value) -> int:
+    """Page size requested by a client, between 1 and MAX_PAGE_SIZE."""
+    limit = int(value) if value not in (None, '') else DEFAULT_PAGE_SIZE
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def parse_cursor(value) -> Optional[int]:
+    """Id a page continues from, None for the first page."""
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('cursor must be the id returned as `next`')
+
+
+def fetch_todos(conn: sqlite3.Connection, user_id: int, date: str, after: Optional[int] = None,
+                limit: Optional[int] = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict], Optional[int]]:
+    """A page of a user's todos for `date` in creation order, and the cursor of the next page.
+
+    Keyset pagination on the (user_id, date) index, whose entries end with the row
+    id: each page seeks past `after` instead of skipping the rows before it. With
+    `limit=None` the page is the rest of the day.
+    """
+    rows = conn.execute('SELECT id, task, completed, date FROM todos WHERE user_id = ? AND date = ? AND id > ? '
+                        'ORDER BY id LIMIT ?', (user_id, date, after or 0, -1 if limit is None else limit + 1)).fetchall()
+    todos = [{'id': row['id'], 'task': row['task'], 'completed': bool(row['completed']), 'date': row['date']}
+             for row in rows[:limit]]
+    return todos, (todos[-1]['id'] if limit is not None and len(rows) > limit else None)
+
+
+def fetch_notifications(conn: sqlite3.Connection, user_id: int, before: Optional[int] = None,
+                        limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict], Optional[int]]:
+    """A page of a user's notifications, newest first, and the cursor of the next page.
+
+    The cursor is the id of the last notification returned; the next page starts
+    below its (created_at, id) on the (user_id, created_at) index.
+    """
+    if before is None:
+        rows = conn.execute('SELECT id, message, created_at FROM notifications WHERE user_id = ? '
+                            'ORDER BY created_at DESC, id DESC LIMIT ?', (user_id, limit + 1)).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT id, message, created_at FROM notifications
+            WHERE user_id = ? AND (created_at, id) < (SELECT created_at, id FROM notifications WHERE id = ? AND user_id = ?)
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', (user_id, before, user_id, limit + 1)).fetchall()
+    notifications = [{'id': row['id'], 'message': row['message'], 'created_at': row['created_at']}
+                     for row in rows[:limit]]
+    return notifications, (notifications[-1]['id'] if len(rows) > limit else None)
+
+
+def delete_old_todos(conn: sqlite3.Connection, before: str, window: int = CLEANUP_WINDOW) -> int:
+    """Delete todos dated before `before` (YYYY-MM-DD); returns the number deleted.
+
+    Like archive_history, the table is walked in id windows of `window` rows with
+    one short transaction each, so writers get the lock between windows and the
+    date needs no index of its own.
+    """
+    start = time.perf_counter()
+    conn.commit()
+    last_id = conn.execute('SELECT coalesce(MAX(id), 0) FROM todos').fetchone()[0]
+    deleted = 0
+    for first in range(0, last_id, window):
+        conn.execute('BEGIN IMMEDIATE')
+        deleted += conn.execute('DELETE FROM todos WHERE id > ? AND id <= ? AND date < ?',
+                                (first, first + window, before)).rowcount
+        conn.commit()
+    elapsed = time.perf_counter() - start
+    metrics.incr('todos_cleanup.deleted', deleted)
+    metrics.observe('todos_cleanup.seconds', elapsed)
+    logger.info(f"Deleted {deleted} todos dated before {before} in {elapsed:.1f}s")
+    return deleted
@@ -0,0 +1,208 @@
+import logging
+import sqlite3
+import time
+from typing import Callable, List
+from mailer.outbox import ensure_outbox
+from tracking.history import ensure_history
+from tracking.rollup import ensure_rollup
+from .schema import (create_history_covering_index, create_history_index, create_todo_notification_indexes,
+                     create_user_data_index)
+
+logger = logging.getLogger(__name__)
+
+# How long a worker waits for another one's migration step (index builds, backfills)
+# before giving up, instead of the pool's busy timeout meant for request queries.
+MIGRATION_LOCK_TIMEOUT_MS = 10 * 60 * 1000
+
+
+class Migration:
+    """One numbered schema change.
+
+    A transactional migration runs inside the runner's exclusive transaction together
+    with its version bump. A non-transactional one commits on its own (for online,
+    batched rewrites); it then has to be safe to run again, or by two processes at once.
+    """
+
+    def __init__(self, version: int, name: str, apply: Callable[[sqlite3.Connection], None],
+                 transactional: bool = True):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.transactional = transactional
+
+
+def create_core_tables(conn: sqlite3.Connection):
+    """The tables and columns init_db used to create, also bringing older databases up to them."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL DEFAULT '',
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+    ''')
+    columns = [col[1] for col in conn.execute('PRAGMA table_info(users)')]
+    if 'name' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN name TEXT NOT NULL DEFAULT ""')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            gender TEXT NOT NULL,
+            age INTEGER NOT NULL,
+            weight REAL NOT NULL,
+            height REAL NOT NULL,
+            water_intake REAL DEFAULT 1.9,
+            water_goal REAL DEFAULT 3.0,
+            steps_count INTEGER DEFAULT 0,
+            steps_goal INTEGER DEFAULT 10000,
+            workout_calories REAL DEFAULT 0,
+            workout_goal REAL DEFAULT 500,
+            sleep_duration REAL DEFAULT 0,
+            sleep_goal REAL DEFAULT 8.0,
+            exercise_hours REAL DEFAULT 0,
+            mood TEXT DEFAULT 'Neutral',
+            avatar_url TEXT,
+            phone TEXT,
+            email TEXT,
+            dob TEXT,
+            goal TEXT,
+            theme TEXT DEFAULT 'light',
+            language TEXT DEFAULT 'en',
+            notification_frequency TEXT DEFAULT 'daily',
+            units TEXT DEFAULT 'metric',
+            data_sharing BOOLEAN DEFAULT FALSE,
+            auto_sync BOOLEAN DEFAULT FALSE,
+            notifications BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    # Databases created by older versions may lack columns added since.
+    columns = {col[1]: col for col in conn.execute('PRAGMA table_info(user_data)')}
+    required_columns = {
+        'water_intake': 'REAL DEFAULT 1.9',
+        'water_goal': 'REAL DEFAULT 3.0',
+        'steps_count': 'INTEGER DEFAULT 0',
+        'steps_goal': 'INTEGER DEFAULT 10000',
+        'workout_calories': 'REAL DEFAULT 0',
+        'workout_goal': 'REAL DEFAULT 500',
+        'sleep_duration': 'REAL DEFAULT 0',
+        'sleep_goal': 'REAL DEFAULT 8.0',
+        'exercise_hours': 'REAL DEFAULT 0',
+        'mood': 'TEXT DEFAULT "Neutral"',
+        'avatar_url': 'TEXT',
+        'phone': 'TEXT',
+        'email': 'TEXT',
+        'dob': 'TEXT',
+        'goal': 'TEXT',
+        'theme': 'TEXT DEFAULT "light"',
+        'language': 'TEXT DEFAULT "en"',
+        'notification_frequency': 'TEXT DEFAULT "daily"',
+        'units': 'TEXT DEFAULT "metric"',
+        'data_sharing': 'BOOLEAN DEFAULT FALSE',
+        'auto_sync': 'BOOLEAN DEFAULT FALSE',
+        'notifications': 'BOOLEAN DEFAULT TRUE'
+    }
+    for col, col_type in required_columns.items():
+        if col not in columns and not (col == 'water_goal' and 'water_max' in columns):
+            conn.execute(f'ALTER TABLE user_data ADD COLUMN {col} {col_type}')
+    if 'water_max' in columns and 'water_goal' not in columns:
+        conn.execute('ALTER TABLE user_data RENAME COLUMN water_max TO water_goal')
+    if 'workout_duration' in columns:
+        conn.execute('ALTER TABLE user_data DROP COLUMN workout_duration')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS todos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            task TEXT NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+
+# Append only: a released migration is never edited or renumbered, and each one
+# creates its indexes from literal definitions. Changing an index takes a new
+# migration calling create_index; changing the rollup trigger, one calling ensure_rollup.
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'core tables', create_core_tables),
+    Migration(2, 'typed tracking history', ensure_history, transactional=False),
+    Migration(3, 'tracking history indexes', create_history_index),
+    Migration(4, 'tracking daily rollup', ensure_rollup),
+    Migration(5, 'unique user_data.user_id', create_user_data_index),
+    Migration(6, 'todo and notification indexes', create_todo_notification_indexes),
+    Migration(7, 'mail outbox', ensure_outbox),
+    Migration(8, 'covering tracking history index', create_history_covering_index),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Version recorded in schema_version, 0 for a database the runner has not touched."""
+    try:
+        row = conn.execute('SELECT version FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def migrate(conn: sqlite3.Connection, migrations: List[Migration] = MIGRATIONS,
+            lock_timeout_ms: int = MIGRATION_LOCK_TIMEOUT_MS) -> int:
+    """Apply the migrations newer than the database's version; returns the resulting version.
+
+    An up-to-date database costs one read of the version row. Otherwise each pending
+    step runs under an exclusive lock and re-reads the version first, so when several
+    workers start together each step is applied once and the others skip it. While
+    migrating, the connection waits up to `lock_timeout_ms` for that lock, so workers
+    queue behind a long step instead of failing with "database is locked".
+    """
+    version = schema_version(conn)
+    pending = [migration for migration in migrations if migration.version > version]
+    if not pending:
+        return version
+    conn.commit()
+    busy_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+    conn.execute(f'PRAGMA busy_timeout={int(lock_timeout_ms)}')
+    try:
+        for migration in pending:
+            start = time.perf_counter()
+            if not migration.transactional:
+                if schema_version(conn) >= migration.version:
+                    continue
+                migration.apply(conn)
+            conn.execute('BEGIN EXCLUSIVE')
+            try:
+                conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+                version = schema_version(conn)
+                if version >= migration.version:
+                    conn.commit()
+                    continue
+                if migration.transactional:
+                    migration.apply(conn)
+                conn.execute('DELETE FROM schema_version')
+                conn.execute('INSERT INTO schema_version (version) VALUES (?)', (migration.version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = migration.version
+            logger.info(f"Applied schema migration {migration.version} ({migration.name}) "
+                        f"in {time.perf_counter() - start:.2f}s")
+    finally:
+        conn.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+    return version
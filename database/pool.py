@@ -0,0 +1,144 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict
+from monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """A pooled connection handed to one caller; `close()` returns it to the pool instead of closing it.
+
+    Like closing a plain connection, returning it rolls back anything left uncommitted.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection, pooled: bool):
+        self.pool = pool
+        self.conn = conn
+        self.pooled = pooled
+        self.released = False
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.conn.__exit__(*exc_info)
+
+    def close(self):
+        self.pool.release(self)
+
+
+class ConnectionPool:
+    """One long-lived SQLite connection per thread, opened with tuned PRAGMAs.
+
+    Connections live in a `threading.local`, so they are reused by every request the
+    thread serves and closed when the thread exits (under gevent's monkey patching the
+    local is per greenlet). If a thread asks for a second connection while its pooled
+    one is still checked out, it gets a temporary connection that is really closed on
+    release, so one caller's rollback never discards another's work.
+    """
+
+    def __init__(self, path: str, cache_size_kb: int = 65536, mmap_size: int = 256 * 1024 * 1024,
+                 busy_timeout_ms: int = 5000):
+        self.path = path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stats_counts: Dict[str, int] = {'hits': 0, 'misses': 0, 'overflow': 0, 'open': 0}
+
+    def connect(self) -> sqlite3.Connection:
+        # Each connection is used by one thread only, but may be closed from another
+        # when its thread exits.
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.stats_counts[name] += amount
+            value = self.stats_counts[name]
+        if name == 'open':
+            metrics.set_gauge('db_pool.open', value)
+        else:
+            metrics.incr(f'db_pool.{name}', amount)
+
+    def acquire(self) -> PooledConnection:
+        start = time.perf_counter()
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None and not self.local.in_use:
+            self.count('hits')
+            pooled = True
+        elif conn is None:
+            self.count('misses')
+            conn = self.connect()
+            self.count('open')
+            # Closing the connection when the thread (and its local) goes away keeps `open` accurate.
+            self.local.conn = conn
+            self.local.finalizer = _Finalizer(self, conn)
+            pooled = True
+        else:
+            self.count('overflow')
+            conn = self.connect()
+            pooled = False
+        if pooled:
+            self.local.in_use = True
+            self.local.checkout = PooledConnection(self, conn, pooled)
+            handle = self.local.checkout
+        else:
+            handle = PooledConnection(self, conn, pooled)
+        metrics.observe('db_pool.wait_seconds', time.perf_counter() - start)
+        return handle
+
+    def release(self, handle: PooledConnection):
+        if handle.released:
+            return
+        handle.released = True
+        try:
+            handle.conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Rolling back pooled connection failed: {e}")
+        if handle.pooled:
+            self.local.in_use = False
+            self.local.checkout = None
+        else:
+            handle.conn.close()
+
+    def release_current(self):
+        """Return this thread's pooled connection if a request left it checked out."""
+        handle = getattr(self.local, 'checkout', None)
+        if handle is not None:
+            self.release(handle)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            counts = dict(self.stats_counts)
+        requests = counts['hits'] + counts['misses'] + counts['overflow']
+        counts['hit_rate'] = round(counts['hits'] / requests, 4) if requests else 0.0
+        return counts
+
+
+class _Finalizer:
+    """Closes a thread's pooled connection when the thread-local that owns it is cleared."""
+
+    def __init__(self, pool: ConnectionPool, conn: sqlite3.Connection):
+        self.pool = pool
+        self.conn = conn
+
+    def __del__(self):
+        try:
+            self.conn.close()
+        except sqlite3.Error:
+            pass
+        self.pool.count('open', -1)
@@ -0,0 +1,94 @@
+import logging
+import re
+import sqlite3
+from typing import Callable, Optional
+from tracking.rollup import day_of, rebuild_days
+
+logger = logging.getLogger(__name__)
+
+
+def deduplicate_history(conn: sqlite3.Connection) -> int:
+    """Keep the last written of each user's entries for one metric and moment.
+
+    Date-stamped edits from the water and steps pages logged a new entry per edit,
+    and single updates now replace the entry in place, so the latest row is the
+    user's correction. The tracking_daily days that lose entries are recomputed.
+    """
+    duplicates = conn.execute(f'''
+        SELECT DISTINCT user_id, type, {day_of('')} FROM tracking_history
+        GROUP BY user_id, type, timestamp HAVING COUNT(*) > 1
+    ''').fetchall()
+    if not duplicates:
+        return 0
+    removed = conn.execute('''
+        DELETE FROM tracking_history WHERE id NOT IN (
+            SELECT MAX(id) FROM tracking_history GROUP BY user_id, type, timestamp
+        )
+    ''').rowcount
+    rebuilt = rebuild_days(conn, [tuple(row) for row in duplicates])
+    users = sorted({row[0] for row in duplicates})
+    logger.warning(f"Removed {removed} superseded tracking_history entries of users {users}; "
+                   f"rebuilt {rebuilt} tracking_daily days")
+    return removed
+
+
+def deduplicate_user_data(conn: sqlite3.Connection) -> int:
+    # Reads without the index returned a user's first row, and updates by user_id
+    # changed all of their rows alike, so the first row is the one to keep.
+    return conn.execute('''
+        DELETE FROM user_data WHERE id NOT IN (
+            SELECT MIN(id) FROM user_data GROUP BY user_id
+        )
+    ''').rowcount
+
+
+def normalize_sql(sql: str) -> str:
+    return re.sub(r'\s+', ' ', sql or '').strip().lower()
+
+
+def create_index(conn: sqlite3.Connection, name: str, definition: str, unique: bool = False,
+                 deduplicate: Optional[Callable[[sqlite3.Connection], int]] = None):
+    """Create index `name` ON `definition`, replacing an index of that name defined otherwise.
+
+    `deduplicate(conn)` removes the rows that would violate a unique index before it
+    is built and returns how many. Migrations call this with literal definitions, so
+    what a released migration creates never changes.
+    """
+    sql = f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {definition}"
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()
+    if row is not None:
+        if normalize_sql(row[0]) == normalize_sql(sql):
+            return
+        logger.info(f"Dropping index {name}")
+        conn.execute(f'DROP INDEX {name}')
+    if deduplicate is not None:
+        removed = deduplicate(conn)
+        if removed:
+            logger.warning(f"Removed {removed} duplicate rows before creating unique index {name}")
+    logger.info(f"Creating index {name} on {definition}")
+    conn.execute(sql)
+
+
+def create_history_index(conn: sqlite3.Connection):
+    # One entry per metric and moment for a user (bulk syncs re-send readings). Replaces
+    # the covering index of the same name that included the value, which could not be unique.
+    create_index(conn, 'idx_tracking_history_user_type_time', 'tracking_history (user_id, type, timestamp DESC)',
+                 unique=True, deduplicate=deduplicate_history)
+
+
+def create_history_covering_index(conn: sqlite3.Connection):
+    # Serves the "latest N entries of one metric for a user" reads from the index alone;
+    # through the unique index each entry costs a table lookup, about twice the read time.
+    create_index(conn, 'idx_tracking_history_latest', 'tracking_history (user_id, type, timestamp DESC, value)')
+
+
+def create_user_data_index(conn: sqlite3.Connection):
+    # One profile row per user; every user_data read and write looks it up by user_id.
+    create_index(conn, 'idx_user_data_user', 'user_data (user_id)', unique=True, deduplicate=deduplicate_user_data)
+
+
+def create_todo_notification_indexes(conn: sqlite3.Connection):
+    # A user's todos of one day, in id order (index entries end with the row id).
+    create_index(conn, 'idx_todos_user_date', 'todos (user_id, date)')
+    # A user's notifications newest first; keyset pages continue from (created_at, id).
+    create_index(conn, 'idx_notifications_user_created', 'notifications (user_id, created_at)')
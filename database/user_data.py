@@ -0,0 +1,34 @@
+import sqlite3
+from functools import lru_cache
+from typing import Dict, Tuple
+
+# user_data columns without a default: a row can only be created with all of them.
+REQUIRED_COLUMNS = ('gender', 'age', 'weight', 'height')
+
+
+@lru_cache(maxsize=None)
+def write_sql(columns: Tuple[str, ...]) -> str:
+    """Statement writing `columns` (named parameters) to the row of `:user_id`.
+
+    Writes that carry the required columns are an upsert. Others are an UPDATE: an
+    INSERT arm without them fails the NOT NULL constraints even when the row exists,
+    because SQLite checks those before resolving the conflict. Both find the row
+    through the unique index on user_id. Cached per column set, so each shape of
+    write keeps hitting sqlite3's statement cache.
+    """
+    if all(column in columns for column in REQUIRED_COLUMNS):
+        return (f"INSERT INTO user_data (user_id, {', '.join(columns)}) "
+                f"VALUES (:user_id, {', '.join(':' + column for column in columns)}) "
+                f"ON CONFLICT (user_id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}")
+    return f"UPDATE user_data SET {', '.join(f'{column} = :{column}' for column in columns)} WHERE user_id = :user_id"
+
+
+def save_user_data(conn: sqlite3.Connection, user_id: int, fields: Dict) -> bool:
+    """Write `fields` to a user's user_data row in one statement; the path for every user_data write.
+
+    Creates the row when `fields` include REQUIRED_COLUMNS, otherwise only updates an
+    existing one. Returns whether a row was written. Column names come from the
+    caller's code, never from a request.
+    """
+    cursor = conn.execute(write_sql(tuple(fields)), {'user_id': user_id, **fields})
+    return cursor.rowcount > 0
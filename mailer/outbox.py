@@ -0,0 +1,204 @@
+import logging
+import smtplib
+import sqlite3
+import threading
+import time
+from typing import Callable, ContextManager, List, Optional
+from flask_mail import Connection, Message
+from monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Messages waiting to be sent. `next_attempt` (epoch milliseconds) is when a worker
+# may pick the message up next, NULL once it has been given up on; sent messages
+# are deleted.
+OUTBOX_TABLE = '''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt INTEGER,
+        last_error TEXT,
+        created_at INTEGER NOT NULL
+    )
+'''
+OUTBOX_INDEX = 'CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt)'
+
+# The server refused this one message; the connection is still good for the others.
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def ensure_outbox(conn: sqlite3.Connection):
+    conn.execute(OUTBOX_TABLE)
+    conn.execute(OUTBOX_INDEX)
+
+
+def now_ms() -> int:
+    return round(time.time() * 1000)
+
+
+def enqueue(conn: sqlite3.Connection, recipient: str, subject: str, body: str) -> int:
+    """Queue a message on the caller's connection; it goes out once the caller commits."""
+    now = now_ms()
+    return conn.execute('INSERT INTO outbox (recipient, subject, body, next_attempt, created_at) VALUES (?, ?, ?, ?, ?)',
+                        (recipient, subject, body, now, now)).lastrowid
+
+
+class SMTPConnection(Connection):
+    """flask_mail connection whose socket gives up after `timeout` seconds, so a stalled
+    server fails the attempt instead of hanging the worker."""
+
+    def __init__(self, mail, timeout: float):
+        super().__init__(mail)
+        self.timeout = timeout
+
+    def configure_host(self):
+        smtp = smtplib.SMTP_SSL if self.mail.use_ssl else smtplib.SMTP
+        host = smtp(self.mail.server, self.mail.port, timeout=self.timeout)
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
+
+
+class OutboxWorker:
+    """Background thread sending the messages queued in the outbox table.
+
+    Due messages are claimed in batches of `batch_size`: their `next_attempt` moves
+    `lease_seconds` ahead in the claiming transaction, so workers in other processes
+    skip them and a worker that dies mid-batch only delays them. All batches found
+    due in one pass go out over a single SMTP connection (`open_connection()`, a
+    context manager yielding an object with `send(message)`). A failed message is
+    retried after `backoff_seconds` doubling per attempt, up to `max_backoff_seconds`,
+    and given up on after `max_attempts`. The thread looks for due messages every
+    `poll_seconds`, or at once after `wake()`.
+    """
+
+    def __init__(self, connect: Callable, open_connection: Callable[[], ContextManager], sender: Optional[str],
+                 poll_seconds: float = 5, batch_size: int = 50, max_attempts: int = 8,
+                 backoff_seconds: float = 30, max_backoff_seconds: float = 3600, lease_seconds: float = 300):
+        self.connect = connect
+        self.open_connection = open_connection
+        self.sender = sender
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='outbox', daemon=True)
+        self.thread.start()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.poll_seconds)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Sending queued mail failed: {e}")
+
+    def claim(self) -> List:
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = now_ms()
+            rows = conn.execute('SELECT id, recipient, subject, body, attempts FROM outbox '
+                                'WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?', (now, self.batch_size)).fetchall()
+            conn.executemany('UPDATE outbox SET next_attempt = ? WHERE id = ?',
+                             [(now + round(self.lease_seconds * 1000), row['id']) for row in rows])
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    def drain(self) -> int:
+        """Send every message due now over one connection; returns the number sent."""
+        rows = self.claim()
+        if not rows:
+            return 0
+        sent = 0
+        connected = False
+        try:
+            with self.open_connection() as smtp:
+                connected = True
+                while rows:
+                    for position, row in enumerate(rows):
+                        start = time.perf_counter()
+                        try:
+                            smtp.send(Message(row['subject'], recipients=[row['recipient']], body=row['body'],
+                                              sender=self.sender))
+                        except MESSAGE_ERRORS as e:
+                            self.failed(row, e)
+                            continue
+                        except Exception as e:
+                            # The connection is unusable: the rest of the batch waits for the next pass.
+                            self.failed(row, e)
+                            self.release(rows[position + 1:])
+                            raise
+                        metrics.observe('outbox.send_seconds', time.perf_counter() - start)
+                        self.delete(row)
+                        sent += 1
+                    rows = self.claim()
+        except Exception as e:
+            if not connected:
+                # Every claimed message counts an attempt when the server cannot be reached.
+                for row in rows:
+                    self.failed(row, e)
+            raise
+        logger.info(f"Sent {sent} queued messages")
+        return sent
+
+    def delete(self, row):
+        conn = self.connect()
+        try:
+            conn.execute('DELETE FROM outbox WHERE id = ?', (row['id'],))
+            conn.commit()
+        finally:
+            conn.close()
+        metrics.incr('outbox.sent')
+
+    def failed(self, row, error):
+        attempts = row['attempts'] + 1
+        if attempts >= self.max_attempts:
+            next_attempt = None
+            metrics.incr('outbox.given_up')
+            logger.error(f"Giving up on message {row['id']} to {row['recipient']} after {attempts} attempts: {error}")
+        else:
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+            next_attempt = now_ms() + round(delay * 1000)
+            metrics.incr('outbox.retries')
+            logger.warning(f"Sending message {row['id']} to {row['recipient']} failed, retrying in {delay:.0f}s: {error}")
+        conn = self.connect()
+        try:
+            conn.execute('UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?',
+                         (attempts, next_attempt, str(error), row['id']))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def release(self, rows):
+        """Make claimed but unsent messages due again, without counting an attempt."""
+        conn = self.connect()
+        try:
+            now = now_ms()
+            conn.executemany('UPDATE outbox SET next_attempt = ? WHERE id = ?', [(now, row['id']) for row in rows])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join(timeout=5)
@@ -0,0 +1,50 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class MetricsRegistry:
+    """Thread-safe in-process counters, gauges and timings, exposed as a JSON snapshot."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, object] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, amount: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration under `name` (count, total, max and last, in seconds)."""
+        with self.lock:
+            timing = self.timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0})
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            timing['last'] = seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            timings = {
+                name: dict(timing, avg=timing['total'] / timing['count'] if timing['count'] else 0.0)
+                for name, timing in self.timings.items()
+            }
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges), 'timings': timings}
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from monitoring.metrics import metrics
+
+# (users row, user_data dict with defaults); either may be None for a missing row.
+Profile = Tuple[Optional[Dict], Optional[Dict]]
+
+
+class ProfileCache:
+    """Bounded per-process LRU of user profiles, invalidated by per-user versions.
+
+    `invalidate(user_id)` drops the entry and, while loads of that user are running,
+    bumps the user's version. A load only stores its result if the version did not
+    change while it ran, so a load racing with an update cannot put the old profile
+    back. Versions are only kept while a user has loads in flight, so they stay as
+    bounded as the entries. Entries also expire after `ttl` seconds, which bounds how
+    long another worker process's update can go unseen. Cached dicts are shared
+    between requests and must not be mutated; `get` returns copies.
+    """
+
+    def __init__(self, load: Callable[[int], Profile], max_entries: int = 10000, ttl: float = 60):
+        self.load = load
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: 'OrderedDict[int, Tuple[float, Profile]]' = OrderedDict()
+        self.versions: Dict[int, int] = {}
+        self.loading: Dict[int, int] = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id: int) -> Profile:
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(user_id)
+                metrics.incr('profile_cache.hits')
+                return copy(entry[1])
+            version = self.versions.setdefault(user_id, 0)
+            self.loading[user_id] = self.loading.get(user_id, 0) + 1
+        metrics.incr('profile_cache.misses')
+        profile = None
+        try:
+            profile = self.load(user_id)
+        finally:
+            with self.lock:
+                if profile is not None and self.versions[user_id] == version:
+                    self.entries[user_id] = (time.monotonic() + self.ttl, profile)
+                    self.entries.move_to_end(user_id)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+                self.loading[user_id] -= 1
+                if not self.loading[user_id]:
+                    del self.loading[user_id]
+                    del self.versions[user_id]
+        return copy(profile)
+
+    def invalidate(self, user_id: int):
+        with self.lock:
+            if user_id in self.versions:
+                self.versions[user_id] += 1
+            self.entries.pop(user_id, None)
+        metrics.incr('profile_cache.invalidations')
+
+    def stats(self) -> Dict:
+        return {'entries': len(self.entries), 'max_entries': self.max_entries, 'ttl': self.ttl}
+
+
+def copy(profile: Profile) -> Profile:
+    user, user_data = profile
+    return (dict(user) if user is not None else None), (dict(user_data) if user_data is not None else None)
@@ -0,0 +1,122 @@
+import itertools
+import logging
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Sequence, Tuple
+from .scoring import ScoringKernel, Term, best_position, best_positions
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class AnswerTable:
+    """Precomputed best-row positions for a closed input space.
+
+    Each axis maps an input key to its allowed values; the last axis must be the
+    last (numeric) scoring term and is scored as a grid. A key outside the axes is
+    reported as MISSING so the caller can fall back to scoring. In 'eager' mode the
+    whole space is built into a dense int32 array up front; in 'lazy' mode answers
+    are memoized per key, up to `max_entries`.
+    """
+
+    def __init__(self, data: pd.DataFrame, terms: Sequence[Term], axes: Dict[str, Sequence],
+                 mode: str = 'lazy', max_entries: int = 200_000):
+        if mode not in ('lazy', 'eager'):
+            raise ValueError(f"Unknown answer table mode: {mode}")
+        if terms[-1].column != list(axes)[-1]:
+            raise ValueError("The last axis of the answer table must be the last scoring term")
+        # Rows with the same scoring signature always tie, and the first one wins,
+        # so only the first occurrence of each signature needs to be scored.
+        columns = [term.column for term in terms]
+        unique = data.drop_duplicates(subset=columns)
+        self.positions = data.index.get_indexer(unique.index)
+        self.kernel = ScoringKernel(unique.reset_index(drop=True), terms)
+        self.axes = {key: list(values) for key, values in axes.items()}
+        self.axis_index = {key: {value: i for i, value in enumerate(values)} for key, values in self.axes.items()}
+        self.mode = mode
+        self.max_entries = max_entries
+        self.answers: Dict[Tuple, int] = {}
+        self.table: Optional[np.ndarray] = None
+        self.build_seconds = 0.0
+        if mode == 'eager':
+            self.build()
+
+    def key(self, user_input: Dict) -> Optional[Tuple]:
+        """Axis indices for a normalized user input, or None if it falls outside the table."""
+        key = []
+        for axis, index in self.axis_index.items():
+            value = user_input.get(axis, MISSING)
+            if isinstance(value, (float, np.floating)) and not float(value).is_integer():
+                return None
+            try:
+                position = index.get(value)
+            except TypeError:
+                return None
+            if position is None:
+                return None
+            key.append(position)
+        return tuple(key)
+
+    def get(self, user_input: Dict):
+        """Best dataset position for the input (None if no row scores), or MISSING if not covered."""
+        key = self.key(user_input)
+        if key is None:
+            return MISSING
+        if self.table is not None:
+            position = int(self.table[key])
+            return None if position < 0 else position
+        position = self.answers.get(key, MISSING)
+        if position is MISSING:
+            best = best_position(self.kernel.score(user_input))
+            position = None if best is None else int(self.positions[best])
+            if len(self.answers) < self.max_entries:
+                self.answers[key] = position
+                if len(self.answers) == self.max_entries:
+                    logger.info(f"Workout answer table reached {self.max_entries} entries: {self.stats()}")
+        return position
+
+    def build(self):
+        """Fill the dense table for every key in the input space."""
+        start = time.perf_counter()
+        *outer_axes, grid_axis = self.axes
+        grid = self.axes[grid_axis]
+        table = np.full(tuple(len(values) for values in self.axes.values()), -1, dtype=np.int32)
+        # The grid term only depends on the row's own grid value, so within a group of
+        # rows sharing that value only the rows with the best partial score can win.
+        grid_values = self.kernel.values[grid_axis]
+        order = np.argsort(grid_values, kind='stable')
+        ranked_values = grid_values[order]
+        same = (ranked_values[1:] == ranked_values[:-1]) | (np.isnan(ranked_values[1:]) & np.isnan(ranked_values[:-1]))
+        starts = np.flatnonzero(np.concatenate(([True], ~same)))
+        sizes = np.diff(np.append(starts, len(order)))
+        for indices in itertools.product(*(range(len(self.axes[axis])) for axis in outer_axes)):
+            user_input = {axis: self.axes[axis][i] for axis, i in zip(outer_axes, indices)}
+            partial = self.kernel.score(user_input, exclude=grid_axis)
+            ranked = partial[order]
+            group_best = np.repeat(np.fmax.reduceat(ranked, starts), sizes)
+            # The margin is far above rounding error, so pruned rows can neither win nor tie.
+            rows = np.sort(order[ranked >= group_best - 1e-9])
+            if rows.size == 0:
+                continue
+            best = best_positions(self.kernel.score_grid(partial, grid, rows))
+            table[indices] = np.where(best < 0, -1, self.positions[rows[best]])
+        self.table = table
+        self.build_seconds = time.perf_counter() - start
+        logger.info(f"Workout answer table built: {self.stats()}")
+
+    def stats(self) -> Dict:
+        """Mode, entry count, approximate memory use and build time of the table."""
+        if self.table is not None:
+            entries, size = self.table.size, self.table.nbytes
+        else:
+            entries = len(self.answers)
+            size = sys.getsizeof(self.answers) + sum(sys.getsizeof(key) for key in self.answers)
+        return {
+            'mode': self.mode,
+            'entries': entries,
+            'bytes': size,
+            'build_seconds': round(self.build_seconds, 3),
+        }
@@ -0,0 +1,146 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from monitoring.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(normalized_input: Dict) -> str:
+    """Canonical text of a normalized user input, independent of key order."""
+    return json.dumps(normalized_input, sort_keys=True, default=str)
+
+
+class MemoryBackend:
+    """Per-process LRU of serialized recommendations with a per-entry expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[Tuple[str, str, str], Tuple[float, str]]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, kind: str, version: str, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get((kind, version, key))
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.entries[(kind, version, key)]
+                return None
+            self.entries.move_to_end((kind, version, key))
+            return entry[1]
+
+    def set(self, kind: str, version: str, key: str, value: str, expires_at: float):
+        with self.lock:
+            self.entries[(kind, version, key)] = (expires_at, value)
+            self.entries.move_to_end((kind, version, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, kind: str, keep_version: Optional[str] = None):
+        with self.lock:
+            for entry_key in [k for k in self.entries if k[0] == kind and k[1] != keep_version]:
+                del self.entries[entry_key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """Recommendations shared by every worker on the host through a local SQLite file.
+
+    Entries are trimmed to `max_entries` (soonest to expire first) every `trim_every`
+    writes rather than on each one, so the table can briefly exceed the bound.
+    """
+
+    def __init__(self, path: str, max_entries: int, trim_every: int = 500):
+        self.path = path
+        self.max_entries = max_entries
+        self.trim_every = trim_every
+        self.writes = 0
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS recommendation_cache (
+                    kind TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (kind, version, key)
+                )
+            ''')
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def get(self, kind: str, version: str, key: str) -> Optional[str]:
+        row = self.connection().execute(
+            'SELECT value FROM recommendation_cache WHERE kind = ? AND version = ? AND key = ? AND expires_at > ?',
+            (kind, version, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, kind: str, version: str, key: str, value: str, expires_at: float):
+        with self.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO recommendation_cache VALUES (?, ?, ?, ?, ?)',
+                         (kind, version, key, value, expires_at))
+            self.writes += 1
+            if self.writes % self.trim_every == 0:
+                conn.execute('DELETE FROM recommendation_cache WHERE expires_at <= ?', (time.time(),))
+                conn.execute('''
+                    DELETE FROM recommendation_cache WHERE rowid IN (
+                        SELECT rowid FROM recommendation_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,))
+
+    def invalidate(self, kind: str, keep_version: Optional[str] = None):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM recommendation_cache WHERE kind = ? AND version IS NOT ?', (kind, keep_version))
+
+    def __len__(self):
+        return self.connection().execute('SELECT COUNT(*) FROM recommendation_cache').fetchone()[0]
+
+
+class RecommendationCache:
+    """Memoizes recommendations per (kind, dataset version, normalized input).
+
+    Values are stored as JSON, so every hit returns a fresh copy. Entries expire after
+    `ttl` seconds; `invalidate` drops a kind's entries from older dataset versions.
+    Hits and misses are counted per kind in the metrics registry.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600, path: Optional[str] = None):
+        self.ttl = ttl
+        self.backend = SQLiteBackend(path, max_entries) if path else MemoryBackend(max_entries)
+
+    def get_or_compute(self, kind: str, version: str, normalized_input: Dict, compute: Callable[[], object]):
+        key = cache_key(normalized_input)
+        try:
+            cached = self.backend.get(kind, version, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Recommendation cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            metrics.incr(f'recommendation_cache.{kind}.hits')
+            return json.loads(cached)
+        metrics.incr(f'recommendation_cache.{kind}.misses')
+        value = compute()
+        try:
+            self.backend.set(kind, version, key, json.dumps(value), time.time() + self.ttl)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Recommendation cache write failed: {e}")
+        return value
+
+    def invalidate(self, kind: str, keep_version: Optional[str] = None):
+        self.backend.invalidate(kind, keep_version)
+        metrics.set_gauge('recommendation_cache.entries', len(self.backend))
@@ -0,0 +1,122 @@
+"""Columnar binary format for the recommendation datasets.
+
+A store is a directory next to the CSV (`diet_dataset.csv` -> `diet_dataset.store/`)
+holding one `.npy` file per column plus `meta.json`. Text columns are stored as
+integer category codes with their distinct values in the string table of
+`meta.json`; numeric columns keep their dtype. Loading memory-maps every array, so
+worker processes share the dataset pages through the OS page cache instead of each
+parsing the CSV into its own object-dtype copy.
+
+Build the stores with:
+
+    python -m recommendation.dataset_store static/datasets/diet_dataset.csv static/datasets/workout_dataset.csv
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def store_path_for(csv_path: str) -> str:
+    """Directory of the binary store built from `csv_path`."""
+    return os.path.splitext(csv_path)[0] + '.store'
+
+
+def code_dtype(categories: int) -> np.dtype:
+    """Smallest signed code dtype pandas uses for this many categories, so loads need no copy."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def build_store(csv_path: str, store_path: str = None) -> str:
+    """Convert a dataset CSV into a binary store and return the store directory."""
+    start = time.perf_counter()
+    store_path = store_path or store_path_for(csv_path)
+    data = pd.read_csv(csv_path)
+    tmp_path = f'{store_path}.tmp-{os.getpid()}'
+    os.makedirs(tmp_path)
+    columns = []
+    for i, name in enumerate(data.columns):
+        column = data[name]
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            np.save(os.path.join(tmp_path, f'{i}.npy'), column.to_numpy())
+            columns.append({'name': name, 'kind': 'numeric', 'file': f'{i}.npy'})
+        else:
+            codes, uniques = pd.factorize(column)
+            np.save(os.path.join(tmp_path, f'{i}.npy'), codes.astype(code_dtype(len(uniques))))
+            columns.append({'name': name, 'kind': 'category', 'file': f'{i}.npy',
+                            'categories': [value if isinstance(value, str) else str(value) for value in uniques]})
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'rows': len(data),
+        'source_mtime': os.path.getmtime(csv_path),
+        'columns': columns,
+    }
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    # Swap the finished directory in so readers never see a partial store.
+    old_path = f'{store_path}.old-{os.getpid()}'
+    if os.path.exists(store_path):
+        os.rename(store_path, old_path)
+    os.rename(tmp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    logger.info(f"Built dataset store {store_path} ({len(data)} rows) in {time.perf_counter() - start:.2f}s")
+    return store_path
+
+
+def read_meta(store_path: str) -> dict:
+    with open(os.path.join(store_path, 'meta.json')) as f:
+        return json.load(f)
+
+
+def load_store(store_path: str) -> pd.DataFrame:
+    """Memory-map a binary store as a DataFrame; text columns come back as categoricals."""
+    meta = read_meta(store_path)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset store version in {store_path}")
+    columns = {}
+    for column in meta['columns']:
+        values = np.load(os.path.join(store_path, column['file']), mmap_mode='r')
+        if column['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, categories=column['categories'], validate=False)
+        columns[column['name']] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def is_fresh(csv_path: str, store_path: str) -> bool:
+    """Whether the store exists and was built from the current version of the CSV."""
+    try:
+        meta = read_meta(store_path)
+    except (OSError, ValueError):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return meta.get('source_mtime') == os.path.getmtime(csv_path)
+
+
+def load_dataset(data_path: str) -> pd.DataFrame:
+    """Load a recommender dataset, preferring an up-to-date binary store over the CSV."""
+    if os.path.isdir(data_path):
+        return load_store(data_path)
+    store_path = store_path_for(data_path)
+    if is_fresh(data_path, store_path):
+        return load_store(store_path)
+    if os.path.isdir(store_path):
+        logger.warning(f"Dataset store {store_path} is stale; parsing {data_path} instead")
+    return pd.read_csv(data_path)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for path in sys.argv[1:]:
+        build_store(path)
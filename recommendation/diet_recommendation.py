@@ -1,12 +1,17 @@
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Optional
+from .dataset_store import load_dataset
+from .restriction_index import RestrictionIndex
+from .scoring import CategoricalTerm, NumericTerm, ScoringKernel, batch_best_positions, best_position, top_positions
+
+MEAL_SLOTS = ['Breakfast', 'Mid-Morning', 'Lunch', 'Evening Snack', 'Dinner', 'Post-Dinner']
 
 class DietRecommendationSystem:
     def __init__(self, data_path: str):
         """Initialize the system by loading the dataset."""
         try:
-            self.data = pd.read_csv(data_path)
+            self.data = load_dataset(data_path)
             self.meal_columns = [
                 'Recommended_Breakfast', 'Breakfast_Calories',
                 'Recommended_Mid-Morning', 'Mid-Morning_Calories',
@@ -16,6 +21,16 @@ class DietRecommendationSystem:
                 'Recommended_Post-Dinner', 'Post-Dinner_Calories'
             ]
             self.validate_data()
+            self.kernel = ScoringKernel(self.data, [
+                NumericTerm('Age', 0.2, 50),
+                CategoricalTerm('Gender', 0.2),
+                CategoricalTerm('Goal', 0.3),
+                CategoricalTerm('Diet_Type', 0.2),
+                CategoricalTerm('Activity_Level', 0.1),
+            ])
+            self.allergy_index = RestrictionIndex(self.data['Allergies'])
+            self.condition_index = RestrictionIndex(self.data['Medical_Conditions'])
+            self.build_meal_plans()
         except FileNotFoundError:
             raise FileNotFoundError(f"Dataset file {data_path} not found.")
         except Exception as e:
@@ -44,7 +59,10 @@ class DietRecommendationSystem:
         return normalized
 
     def calculate_similarity(self, user_input: Dict, row: pd.Series) -> float:
-        """Calculate similarity score between user input and a dataset row."""
+        """Calculate similarity score between user input and a dataset row.
+
+        Reference implementation of `self.kernel`, which scores all rows at once.
+        """
         score = 0.0
         max_age_diff = 50
         age_diff = abs(user_input.get('Age', row['Age']) - row['Age'])
@@ -59,35 +77,116 @@ class DietRecommendationSystem:
             score += 0.1
         return score
 
-    def filter_by_restrictions(self, df: pd.DataFrame, allergies: Optional[str], medical_conditions: Optional[str]) -> pd.DataFrame:
-        """Filter dataset based on allergies and medical conditions."""
-        filtered_df = df.copy()
+    def restriction_bitmap(self, allergies: Optional[str], medical_conditions: Optional[str]) -> np.ndarray:
+        """Packed bitmap of dataset rows compatible with the allergies and medical conditions."""
+        keep = self.allergy_index.all_rows()
         if allergies and allergies.lower() != 'none':
             allergy_list = allergies.split(',')
             for allergy in allergy_list:
-                filtered_df = filtered_df[~filtered_df['Allergies'].str.contains(allergy.strip(), case=False, na=False)]
+                keep &= ~self.allergy_index.contains(allergy.strip())
         if medical_conditions and medical_conditions.lower() != 'none':
             condition_list = medical_conditions.split(',')
+            no_condition = self.condition_index.equals('None')
             for condition in condition_list:
-                filtered_df = filtered_df[
-                    filtered_df['Medical_Conditions'].str.contains(condition.strip(), case=False, na=False) |
-                    (filtered_df['Medical_Conditions'] == 'None')
-                ]
-        return filtered_df
+                keep &= self.condition_index.contains(condition.strip()) | no_condition
+        return keep
 
-    def recommend_diet(self, user_input: Dict) -> Optional[Dict]:
-        """Recommend a diet plan based on user input."""
-        user_input = self.normalize_input(user_input)
-        filtered_data = self.filter_by_restrictions(
-            self.data,
+    def restriction_mask(self, allergies: Optional[str], medical_conditions: Optional[str]) -> np.ndarray:
+        """Boolean mask of dataset rows compatible with the allergies and medical conditions."""
+        return self.allergy_index.unpack(self.restriction_bitmap(allergies, medical_conditions))
+
+    def filter_by_restrictions(self, df: pd.DataFrame, allergies: Optional[str], medical_conditions: Optional[str]) -> pd.DataFrame:
+        """Filter the loaded dataset (`df` is `self.data`) based on allergies and medical conditions."""
+        return df[self.restriction_mask(allergies, medical_conditions)]
+
+    def candidate_mask(self, user_input: Dict) -> Optional[np.ndarray]:
+        """Rows allowed by the user's restrictions, or None to score every row."""
+        candidates = self.restriction_mask(
             user_input.get('Allergies'),
             user_input.get('Medical_Conditions')
         )
-        if filtered_data.empty:
-            filtered_data = self.data.copy()  # Fallback to avoid empty results
-        scores = filtered_data.apply(lambda row: self.calculate_similarity(user_input, row), axis=1)
-        best_match_idx = scores.idxmax()
-        best_match = filtered_data.loc[best_match_idx]
+        if not candidates.any():
+            return None  # Fallback to all rows to avoid empty results
+        return candidates
+
+    def recommend_diet(self, user_input: Dict) -> Optional[Dict]:
+        """Recommend a diet plan based on user input."""
+        user_input = self.normalize_input(user_input)
+        best_match_pos = best_position(self.kernel.score(user_input), self.candidate_mask(user_input))
+        if best_match_pos is None:
+            return None
+        return self.meal_plan(best_match_pos)
+
+    def recommend_diet_topk(self, user_input: Dict, k: int) -> List[Dict]:
+        """Recommend up to `k` diet plans, best first, from a single scoring pass."""
+        user_input = self.normalize_input(user_input)
+        positions = top_positions(self.kernel.score(user_input), k, self.candidate_mask(user_input))
+        return [self.meal_plan(position) for position in positions]
+
+    def recommend_diet_batch(self, user_inputs: List[Dict]) -> List[Optional[Dict]]:
+        """Recommend a diet plan for each user input, scoring them together in bounded blocks."""
+        user_inputs = [self.normalize_input(user_input) for user_input in user_inputs]
+        bitmaps = []
+        for user_input in user_inputs:
+            bitmap = self.restriction_bitmap(user_input.get('Allergies'), user_input.get('Medical_Conditions'))
+            bitmaps.append(bitmap if bitmap.any() else None)  # None falls back to all rows
+
+        def candidates(users, start, stop):
+            if all(bitmaps[i] is None for i in users):
+                return None
+            return np.stack([
+                np.ones(stop - start, dtype=bool) if bitmaps[i] is None else self.allergy_index.unpack(bitmaps[i], start, stop)
+                for i in users
+            ])
+
+        positions = batch_best_positions(self.kernel, user_inputs, candidates)
+        return [None if position is None else self.meal_plan(position) for position in positions]
+
+    def meal_plan(self, position: int) -> Dict:
+        """Meal plan payload for the dataset row at `position`, prebuilt at load time.
+
+        Payloads are shared between requests and must not be modified by callers.
+        """
+        meal_plan = self.meal_plans[self.plan_ids[position]]
+        if meal_plan is None:
+            raise ValueError(f"Dataset row {position} has missing meal calories")
+        return meal_plan
+
+    def build_meal_plans(self):
+        """Materialize the payload of every distinct meal plan once; rows keep the id of theirs.
+
+        Identical slots (same meal and calories) share one dict, and plans with a missing
+        calorie value are stored as None, where `meal_plan_from_row` would raise.
+        """
+        meals = self.data[self.meal_columns]
+        self.plan_ids = meals.groupby(self.meal_columns, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        _, first_rows = np.unique(self.plan_ids, return_index=True)
+        plans = meals.iloc[first_rows].reset_index(drop=True)
+        calories = np.column_stack([plans[column].to_numpy(dtype=np.float64) for column in self.meal_columns[1::2]])
+        totals = np.nansum(calories, axis=1).astype(np.int64).tolist()
+        # Post-Dinner is optional: without a meal its calories are reported as 0.
+        calories[pd.isna(plans['Recommended_Post-Dinner']).to_numpy(), -1] = 0
+        incomplete = np.isnan(calories).any(axis=1).tolist()
+        slot_columns = []
+        for j, column in enumerate(self.meal_columns[0::2]):
+            slot = pd.DataFrame({'Meal': plans[column], 'Calories': calories[:, j]})
+            slot_ids = slot.groupby(['Meal', 'Calories'], dropna=False, sort=False, observed=True).ngroup().to_numpy()
+            _, first = np.unique(slot_ids, return_index=True)
+            meals_first = plans[column].iloc[first].astype(object).tolist()
+            calories_first = np.nan_to_num(calories[first, j]).astype(np.int64).tolist()
+            slot_dicts = [{'Meal': meal, 'Calories': value} for meal, value in zip(meals_first, calories_first)]
+            slot_columns.append([slot_dicts[i] for i in slot_ids.tolist()])
+        keys = MEAL_SLOTS + ['Total Calories']
+        self.meal_plans: List[Optional[Dict]] = [
+            None if row[0] else dict(zip(keys, row[1:]))
+            for row in zip(incomplete, *slot_columns, totals)
+        ]
+
+    def meal_plan_from_row(self, best_match: pd.Series) -> Dict:
+        """Build the meal plan payload from a dataset row.
+
+        Reference implementation of `build_meal_plans`, which prebuilds every payload.
+        """
         meal_plan = {
             'Breakfast': {
                 'Meal': best_match['Recommended_Breakfast'],
@@ -115,4 +214,4 @@ class DietRecommendationSystem:
             },
             'Total Calories': int(best_match[self.meal_columns[1::2]].sum())
         }
-        return meal_plan
\ No newline at end of file
+        return meal_plan
@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence
+from monitoring.metrics import metrics
+from .dataset_store import store_path_for
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_files(data_path: str) -> List[str]:
+    """Files whose changes should trigger a reload of a recommender built from `data_path`."""
+    return [data_path, os.path.join(store_path_for(data_path), 'meta.json')]
+
+
+def fingerprint(paths: Sequence[str]) -> str:
+    """Short version id derived from the size and mtime of each path (missing files count too)."""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        except OSError:
+            digest.update(f'{path}:missing;'.encode())
+    return digest.hexdigest()[:12]
+
+
+class Loaded:
+    """One immutable version of a recommender; requests keep the instance they started with."""
+
+    def __init__(self, version: str, generation: int, recommender, loaded_at: float):
+        self.version = version
+        self.generation = generation
+        self.recommender = recommender
+        self.loaded_at = loaded_at
+
+
+class RecommenderRegistry:
+    """Versioned recommenders that are rebuilt in the background and swapped in atomically.
+
+    Each entry is built by a factory from a set of watched files; its version is a
+    fingerprint of those files. `check_for_changes` (run periodically) and `reload`
+    (the admin trigger) build the new recommender on a worker thread while requests
+    keep using the current one, then replace the entry with a single assignment. A
+    failed build is logged and leaves the current version active.
+    """
+
+    def __init__(self):
+        self.factories: Dict[str, Callable[[], object]] = {}
+        self.paths: Dict[str, List[str]] = {}
+        self.active: Dict[str, Loaded] = {}
+        self.reloading: Dict[str, threading.Lock] = {}
+        self.listeners: List[Callable[[str, Loaded], None]] = []
+
+    def register(self, name: str, factory: Callable[[], object], paths: Sequence[str]):
+        """Build the first version of `name` synchronously; errors propagate to the caller."""
+        self.factories[name] = factory
+        self.paths[name] = list(paths)
+        self.reloading[name] = threading.Lock()
+        self.build(name)
+
+    def on_swap(self, listener: Callable[[str, Loaded], None]):
+        """Call `listener(name, loaded)` after each new version becomes active."""
+        self.listeners.append(listener)
+
+    def current(self, name: str) -> Loaded:
+        """The active version; use its recommender and version together to stay consistent."""
+        return self.active[name]
+
+    def get(self, name: str):
+        return self.active[name].recommender
+
+    def version(self, name: str) -> str:
+        return self.active[name].version
+
+    def build(self, name: str) -> Loaded:
+        version = fingerprint(self.paths[name])
+        start = time.perf_counter()
+        recommender = self.factories[name]()
+        seconds = time.perf_counter() - start
+        current = self.active.get(name)
+        loaded = Loaded(version, current.generation + 1 if current else 1, recommender, time.time())
+        self.active[name] = loaded
+        for listener in self.listeners:
+            try:
+                listener(name, loaded)
+            except Exception as e:
+                logger.error(f"Recommender swap listener failed for {name}: {e}")
+        metrics.observe(f'recommender.{name}.reload_seconds', seconds)
+        metrics.set_gauge(f'recommender.{name}.version', loaded.version)
+        metrics.set_gauge(f'recommender.{name}.generation', loaded.generation)
+        metrics.set_gauge(f'recommender.{name}.loaded_at', loaded.loaded_at)
+        logger.info(f"Loaded {name} recommender version {version} (generation {loaded.generation}) in {seconds:.2f}s")
+        return loaded
+
+    def reload(self, name: str, background: bool = True) -> bool:
+        """Rebuild `name`, on a worker thread by default. Returns False if a reload is already running."""
+        lock = self.reloading[name]
+        if not lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self.build(name)
+            except Exception as e:
+                metrics.incr(f'recommender.{name}.reload_failures')
+                logger.error(f"Reloading {name} recommender failed, keeping version {self.version(name)}: {e}")
+            finally:
+                lock.release()
+
+        if background:
+            threading.Thread(target=run, name=f'reload-{name}', daemon=True).start()
+        else:
+            run()
+        return True
+
+    def check_for_changes(self) -> List[str]:
+        """Start a reload for every recommender whose watched files changed; returns their names."""
+        changed = []
+        for name, paths in self.paths.items():
+            if fingerprint(paths) != self.active[name].version and self.reload(name):
+                changed.append(name)
+        return changed
+
+    def status(self) -> Dict:
+        return {
+            name: {
+                'version': loaded.version,
+                'generation': loaded.generation,
+                'loaded_at': datetime.fromtimestamp(loaded.loaded_at).strftime('%Y-%m-%d %H:%M:%S'),
+                'reloading': self.reloading[name].locked(),
+            }
+            for name, loaded in self.active.items()
+        }
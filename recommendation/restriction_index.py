@@ -0,0 +1,54 @@
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+
+class RestrictionIndex:
+    """Inverted index from the distinct values of a restriction column to packed row bitmaps.
+
+    A search term is matched once against the distinct cell values (with the same
+    case-insensitive regex search as `Series.str.contains(term, case=False, na=False)`)
+    and the bitmaps of the matching values are OR-ed together. Term bitmaps are cached,
+    so filtering a request is a few bitwise operations over `rows / 8` bytes.
+    """
+
+    def __init__(self, column: pd.Series, cache_size: int = 1024):
+        codes, uniques = pd.factorize(column)
+        self.size = len(column)
+        self.values = list(uniques)
+        self.bitmaps = [np.packbits(codes == code) for code in range(len(self.values))]
+        self.empty = np.packbits(np.zeros(self.size, dtype=bool))
+        self.full = np.packbits(np.ones(self.size, dtype=bool))
+        self.cache_size = cache_size
+        self.cache: Dict[str, np.ndarray] = {}
+
+    def all_rows(self) -> np.ndarray:
+        """Packed bitmap with every row set (padding bits stay clear)."""
+        return self.full.copy()
+
+    def equals(self, value) -> np.ndarray:
+        """Packed bitmap of rows whose cell is exactly `value`."""
+        for code, candidate in enumerate(self.values):
+            if candidate == value:
+                return self.bitmaps[code]
+        return self.empty
+
+    def contains(self, term: str) -> np.ndarray:
+        """Packed bitmap of rows whose cell matches `term` case-insensitively."""
+        bitmap = self.cache.get(term)
+        if bitmap is None:
+            pattern = re.compile(term, flags=re.IGNORECASE)
+            bitmap = self.empty.copy()
+            for code, value in enumerate(self.values):
+                if isinstance(value, str) and pattern.search(value):
+                    bitmap |= self.bitmaps[code]
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[term] = bitmap
+        return bitmap
+
+    def unpack(self, bitmap: np.ndarray, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Boolean row mask for a packed bitmap, optionally for rows [start, stop) with `start % 8 == 0`."""
+        stop = self.size if stop is None else stop
+        return np.unpackbits(bitmap[start // 8:], count=stop - start).astype(bool)
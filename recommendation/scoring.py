@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+
+class CategoricalTerm:
+    """Adds `weight` to every row whose column equals the user's value."""
+
+    def __init__(self, column: str, weight: float):
+        self.column = column
+        self.weight = weight
+
+
+class NumericTerm:
+    """Adds `weight * (1 - |user - row| / scale)`, optionally capping the distance ratio at 1."""
+
+    def __init__(self, column: str, weight: float, scale: float, clamp: bool = False):
+        self.column = column
+        self.weight = weight
+        self.scale = scale
+        self.clamp = clamp
+
+
+Term = Union[CategoricalTerm, NumericTerm]
+
+
+def encode(column: pd.Series):
+    """Integer codes of a column (-1 for NaN) and the code of each distinct value.
+
+    Categorical columns (as loaded from a dataset store) reuse their codes without a copy.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), {value: code for code, value in enumerate(column.cat.categories)}
+    codes, uniques = pd.factorize(column)
+    return codes.astype(np.int32), {value: code for code, value in enumerate(uniques)}
+
+
+class ScoringKernel:
+    """Columnar re-implementation of the row-wise `calculate_similarity` methods.
+
+    Categorical columns are encoded once into integer codes and numeric columns into
+    float arrays, so scoring a user becomes a handful of NumPy operations over the
+    whole dataset. Terms are applied in the same order as the row-wise scorers, which
+    keeps the floating point results bit-for-bit identical.
+    """
+
+    def __init__(self, data: pd.DataFrame, terms: Sequence[Term]):
+        self.terms = list(terms)
+        self.size = len(data)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.lookup: Dict[str, Dict] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        for term in self.terms:
+            if isinstance(term, CategoricalTerm):
+                self.codes[term.column], self.lookup[term.column] = encode(data[term.column])
+            else:
+                self.values[term.column] = data[term.column].to_numpy(dtype=np.float64)
+
+    def score(self, user_input: Dict, exclude: Optional[str] = None) -> np.ndarray:
+        """Score every dataset row against a (normalized) user input, optionally skipping one term."""
+        scores = np.zeros(self.size)
+        for term in self.terms:
+            if term.column == exclude:
+                continue
+            if isinstance(term, CategoricalTerm):
+                np.add(scores, term.weight, out=scores, where=self.match_mask(term.column, user_input))
+            else:
+                scores += term.weight * (1 - self.distance_ratio(term, user_input))
+        return scores
+
+    def score_block(self, user_inputs: Sequence[Dict], start: int, stop: int) -> np.ndarray:
+        """Scores of rows [start, stop) for several users, as a `len(user_inputs) x rows` matrix.
+
+        Row `i` equals `self.score(user_inputs[i])[start:stop]` exactly.
+        """
+        scores = np.zeros((len(user_inputs), stop - start))
+        for term in self.terms:
+            if isinstance(term, CategoricalTerm):
+                codes = self.codes[term.column][None, start:stop]
+                lookup = self.lookup[term.column]
+                # NaN cells are coded -1, so -2 marks a missing key (matches every non-NaN
+                # cell) and -3 a value absent from the dataset (matches nothing).
+                wanted = np.array([
+                    lookup.get(user_input[term.column], -3) if term.column in user_input else -2
+                    for user_input in user_inputs
+                ], dtype=np.int32)[:, None]
+                mask = (codes == wanted) | ((wanted == -2) & (codes >= 0))
+                np.add(scores, term.weight, out=scores, where=mask)
+            else:
+                values = self.values[term.column][None, start:stop]
+                given = np.array([term.column in user_input for user_input in user_inputs])[:, None]
+                wanted = np.array([user_input.get(term.column, np.nan) for user_input in user_inputs], dtype=np.float64)[:, None]
+                ratio = np.where(given, np.abs(wanted - values) / term.scale, np.where(np.isnan(values), np.nan, 0.0))
+                if term.clamp:
+                    ratio = np.minimum(ratio, 1)
+                scores += term.weight * (1 - ratio)
+        return scores
+
+    def score_grid(self, partial: np.ndarray, grid: Sequence[float], rows: np.ndarray) -> np.ndarray:
+        """Complete `partial` scores of `rows` for every value of the last term's input.
+
+        `partial` is `score(user_input, exclude=last_term.column)`. Because the last
+        term is added last, row `i` of the `len(grid) x len(rows)` result equals
+        `score({**user_input, column: grid[i]})[rows]` exactly.
+        """
+        term = self.terms[-1]
+        grid = np.asarray(grid, dtype=np.float64)[:, None]
+        ratio = np.abs(grid - self.values[term.column][rows][None, :]) / term.scale
+        if term.clamp:
+            ratio = np.minimum(ratio, 1)
+        return partial[rows][None, :] + term.weight * (1 - ratio)
+
+    def match_mask(self, column: str, user_input: Dict) -> np.ndarray:
+        """Rows whose categorical value equals the user's value for `column`."""
+        codes = self.codes[column]
+        if column not in user_input:
+            # A missing key compares each row with itself, which only fails for NaN cells.
+            return codes >= 0
+        code = self.lookup[column].get(user_input[column])
+        if code is None:
+            return np.zeros(self.size, dtype=bool)
+        return codes == code
+
+    def distance_ratio(self, term: NumericTerm, user_input: Dict) -> np.ndarray:
+        """Per-row `|user - row| / scale`, capped at 1 for clamped terms."""
+        values = self.values[term.column]
+        if term.column in user_input:
+            ratio = np.abs(user_input[term.column] - values) / term.scale
+        else:
+            ratio = np.where(np.isnan(values), np.nan, 0.0)
+        if term.clamp:
+            ratio = np.minimum(ratio, 1)
+        return ratio
+
+
+def best_position(scores: np.ndarray, candidates: Optional[np.ndarray] = None) -> Optional[int]:
+    """Position of the highest score, first occurrence wins, NaN scores are skipped.
+
+    Mirrors `Series.idxmax` over the candidate rows, given either as row positions or
+    as a boolean mask. Returns None when no candidate has a usable score.
+    """
+    if candidates is not None and candidates.dtype == bool:
+        scores = np.where(candidates, scores, np.nan)
+        candidates = None
+    if candidates is not None:
+        scores = scores[candidates]
+    if scores.size == 0:
+        return None
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    best = int(np.argmax(scores))
+    if scores[best] == -np.inf:
+        return None
+    return int(candidates[best]) if candidates is not None else best
+
+
+def best_positions(scores: np.ndarray) -> np.ndarray:
+    """Row-wise `best_position` for a 2-D score matrix; -1 where a row has no usable score."""
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    best = np.argmax(scores, axis=1)
+    best[scores[np.arange(len(scores)), best] == -np.inf] = -1
+    return best
+
+
+def top_positions(scores: np.ndarray, k: int, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+    """Positions of the `k` highest scores, best first, ties broken by lower position.
+
+    Uses `argpartition` to find the k-th best score in linear time, then sorts only the
+    selected rows. NaN scores and rows outside `candidates` (positions or a boolean
+    mask) are never selected; fewer than `k` positions come back if fewer are usable.
+    """
+    if candidates is not None:
+        allowed = candidates if candidates.dtype == bool else np.isin(np.arange(len(scores)), candidates)
+        scores = np.where(allowed, scores, np.nan)
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    usable = int(np.count_nonzero(scores > -np.inf))
+    k = min(k, usable)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    threshold = scores[np.argpartition(scores, len(scores) - k)[len(scores) - k]]
+    above = np.flatnonzero(scores > threshold)
+    # Among rows tied at the threshold, the lowest positions fill the remaining slots.
+    tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+    chosen = np.concatenate((above, tied))
+    return chosen[np.lexsort((chosen, -scores[chosen]))]
+
+
+def batch_best_positions(kernel: ScoringKernel, user_inputs: Sequence[Dict],
+                         candidates: Optional[Callable[[Sequence[int], int, int], Optional[np.ndarray]]] = None,
+                         max_cells: int = 1 << 21) -> List[Optional[int]]:
+    """`best_position` for many users, scored as a users x rows matrix in bounded blocks.
+
+    Users are processed in chunks and rows in blocks so that no score matrix holds
+    more than about `max_cells` floats. `candidates(users, start, stop)` may return a
+    boolean `len(users) x (stop - start)` mask of allowed rows for that block.
+    Results are identical to calling `best_position` once per user.
+    """
+    results: List[Optional[int]] = [None] * len(user_inputs)
+    if kernel.size == 0:
+        return results
+    user_chunk = max(1, min(len(user_inputs), 256))
+    # Blocks are a multiple of 8 rows so candidate bitmaps can be unpacked per block.
+    block_rows = max(8, min(kernel.size, max_cells // user_chunk) // 8 * 8)
+    for first in range(0, len(user_inputs), user_chunk):
+        users = range(first, min(first + user_chunk, len(user_inputs)))
+        chunk = [user_inputs[i] for i in users]
+        best_score = np.full(len(chunk), -np.inf)
+        best_pos = np.full(len(chunk), -1)
+        for start in range(0, kernel.size, block_rows):
+            stop = min(start + block_rows, kernel.size)
+            scores = kernel.score_block(chunk, start, stop)
+            if candidates is not None:
+                allowed = candidates(users, start, stop)
+                if allowed is not None:
+                    scores = np.where(allowed, scores, np.nan)
+            scores = np.where(np.isnan(scores), -np.inf, scores)
+            block_best = np.argmax(scores, axis=1)
+            block_score = scores[np.arange(len(chunk)), block_best]
+            # Strictly greater keeps the earlier block on ties, so the first occurrence wins.
+            better = block_score > best_score
+            best_score[better] = block_score[better]
+            best_pos[better] = start + block_best[better]
+        for i, position in zip(users, best_pos):
+            results[i] = int(position) if position >= 0 else None
+    return results
@@ -1,13 +1,41 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+from .answer_table import MISSING, AnswerTable
+from .dataset_store import load_dataset
+from .scoring import CategoricalTerm, NumericTerm, ScoringKernel, batch_best_positions, best_position, top_positions
+
+# Closed input space accepted by /recommend_workout and /api/recommend_workout.
+# The time axis must stay last: the answer table scores it as a grid.
+ANSWER_TABLE_AXES = {
+    'Gender': ['Male', 'Female'],
+    'Fitness_Level': ['Beginner', 'Intermediate', 'Advanced'],
+    'Goal': ['Strength', 'Endurance', 'Flexibility', 'Weight Loss'],
+    'Workout_Preference': ['Home', 'Gym', 'Outdoor'],
+    'Age': range(1, 121),
+    'Workout_Time_per_day_mins': range(10, 241),
+}
 
 class WorkoutRecommendationSystem:
-    def __init__(self, data_path: str):
-        """Initialize the system by loading the workout dataset."""
+    def __init__(self, data_path: str, answer_table: Optional[str] = None):
+        """Initialize the system by loading the workout dataset.
+
+        `answer_table` enables the precomputed answer table: 'eager' builds it for the
+        whole input space at startup, 'lazy' memoizes answers per input, None disables it.
+        """
         try:
-            self.data = pd.read_csv(data_path)
+            self.data = load_dataset(data_path)
             self.validate_data()
+            terms = [
+                NumericTerm('Age', 0.2, 50),
+                CategoricalTerm('Gender', 0.2),
+                CategoricalTerm('Fitness_Level', 0.3),
+                CategoricalTerm('Goal', 0.2),
+                CategoricalTerm('Workout_Preference', 0.1),
+                NumericTerm('Workout_Time_per_day_mins', 0.2, 120, clamp=True),
+            ]
+            self.kernel = ScoringKernel(self.data, terms)
+            self.answer_table = AnswerTable(self.data, terms, ANSWER_TABLE_AXES, mode=answer_table) if answer_table else None
         except FileNotFoundError:
             raise FileNotFoundError(f"Dataset file {data_path} not found.")
         except Exception as e:
@@ -29,7 +57,10 @@ class WorkoutRecommendationSystem:
         return normalized
 
     def calculate_similarity(self, user_input: Dict, row: pd.Series) -> float:
-        """Calculate similarity score between user input and a dataset row."""
+        """Calculate similarity score between user input and a dataset row.
+
+        Reference implementation of `self.kernel`, which scores all rows at once.
+        """
         score = 0.0
         max_age_diff = 50
         age_diff = abs(user_input.get('Age', row['Age']) - row['Age'])
@@ -49,17 +80,54 @@ class WorkoutRecommendationSystem:
 
     def filter_by_restrictions(self, df: pd.DataFrame) -> pd.DataFrame:
         """Filter dataset based on any potential restrictions (e.g., injuries could be added)."""
-        return df.copy()  # Placeholder; extend with injury or other filters if needed
+        return df  # Placeholder; extend with injury or other filters if needed
+
+    def candidate_rows(self) -> Optional[np.ndarray]:
+        """Positions of the rows left by `filter_by_restrictions`, or None to score every row."""
+        filtered_data = self.filter_by_restrictions(self.data)
+        if filtered_data.empty or len(filtered_data) == len(self.data):
+            return None  # Fallback to all rows to avoid empty results
+        return self.data.index.get_indexer(filtered_data.index)
 
     def recommend_workout(self, user_input: Dict) -> Optional[Dict]:
         """Recommend a workout plan based on user input."""
         user_input = self.normalize_input(user_input)
-        filtered_data = self.filter_by_restrictions(self.data)
-        if filtered_data.empty:
-            filtered_data = self.data.copy()  # Fallback to avoid empty results
-        scores = filtered_data.apply(lambda row: self.calculate_similarity(user_input, row), axis=1)
-        best_match_idx = scores.idxmax()
-        best_match = filtered_data.loc[best_match_idx]
+        best_match_pos = self.answer_table.get(user_input) if self.answer_table else MISSING
+        if best_match_pos is MISSING:
+            best_match_pos = best_position(self.kernel.score(user_input), self.candidate_rows())
+        if best_match_pos is None:
+            return None
+        return self.workout_plan(best_match_pos)
+
+    def recommend_workout_topk(self, user_input: Dict, k: int) -> List[Dict]:
+        """Recommend up to `k` workout plans, best first, from a single scoring pass."""
+        user_input = self.normalize_input(user_input)
+        positions = top_positions(self.kernel.score(user_input), k, self.candidate_rows())
+        return [self.workout_plan(position) for position in positions]
+
+    def recommend_workout_batch(self, user_inputs: List[Dict]) -> List[Optional[Dict]]:
+        """Recommend a workout plan for each user input, scoring them together in bounded blocks."""
+        user_inputs = [self.normalize_input(user_input) for user_input in user_inputs]
+        positions = [self.answer_table.get(user_input) if self.answer_table else MISSING for user_input in user_inputs]
+        pending = [i for i, position in enumerate(positions) if position is MISSING]
+        if pending:
+            rows = self.candidate_rows()
+            allowed = None
+            if rows is not None:
+                allowed = np.zeros(len(self.data), dtype=bool)
+                allowed[rows] = True
+            scored = batch_best_positions(
+                self.kernel,
+                [user_inputs[i] for i in pending],
+                None if allowed is None else lambda users, start, stop: np.broadcast_to(allowed[start:stop], (len(users), stop - start))
+            )
+            for i, position in zip(pending, scored):
+                positions[i] = position
+        return [None if position is None else self.workout_plan(position) for position in positions]
+
+    def workout_plan(self, position: int) -> Dict:
+        """Build the workout plan payload for the dataset row at `position`."""
+        best_match = self.data.iloc[position]
         workout_plan = {
             'Workout_Type': best_match['Recommended_Workout'],
             'Exercises': best_match['Workout_Exercises'].split(', '),
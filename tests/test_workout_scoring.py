@@ -0,0 +1,69 @@
+"""The vectorized workout scorer must match the row-wise `calculate_similarity` exactly."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommendation.scoring import best_position
+from recommendation.workout_recommendation import WorkoutRecommendationSystem
+
+ROWS = [
+    # Age, Gender, Fitness_Level, Goal, Workout_Time_per_day_mins, Workout_Preference
+    (30, 'Male', 'Intermediate', 'Endurance', 60, 'Home'),
+    (30, 'Male', 'Intermediate', 'Endurance', 60, 'Home'),
+    (45, 'Female', 'Beginner', 'Weight Loss', 30, 'Gym'),
+    (22, 'Female', 'Advanced', 'Strength', 90, 'Outdoor'),
+    (60, 'Male', 'Beginner', 'Flexibility', 15, 'Home'),
+    (np.nan, 'Female', 'Intermediate', 'Endurance', 45, 'Gym'),
+    (35, np.nan, 'Advanced', 'Strength', 120, 'Gym'),
+    (28, 'Male', np.nan, 'Weight Loss', np.nan, 'Outdoor'),
+]
+COLUMNS = ['Age', 'Gender', 'Fitness_Level', 'Goal', 'Workout_Time_per_day_mins', 'Workout_Preference']
+
+CASES = {
+    'empty input': {},
+    'age only': {'Age': 30},
+    'missing numeric fields': {'Gender': 'Male', 'Fitness_Level': 'Beginner'},
+    'unknown categorical values': {'Age': 25, 'Gender': 'Other', 'Fitness_Level': 'Elite', 'Goal': 'Strength',
+                                   'Workout_Preference': 'Pool', 'Workout_Time_per_day_mins': 60},
+    'capped time difference': {'Age': 120, 'Gender': 'Female', 'Fitness_Level': 'Advanced', 'Goal': 'Weight Loss',
+                               'Workout_Preference': 'Gym', 'Workout_Time_per_day_mins': 240},
+    'tie between identical rows': {'Age': 30, 'Gender': 'male', 'Fitness_Level': 'intermediate', 'Goal': 'endurance',
+                                   'Workout_Preference': 'home', 'Workout_Time_per_day_mins': 60},
+    'fractional numbers': {'Age': 40.5, 'Gender': 'Male', 'Workout_Time_per_day_mins': 37.5},
+}
+
+
+def build_system(tmp_path, frame):
+    frame = frame.assign(Recommended_Workout='Full Body', Workout_Exercises='Squats, Plank')
+    path = tmp_path / 'workout_dataset.csv'
+    frame.to_csv(path, index=False)
+    return WorkoutRecommendationSystem(str(path))
+
+
+@pytest.fixture(params=['nan cells', 'nan columns'])
+def system(request, tmp_path):
+    frame = pd.DataFrame(ROWS, columns=COLUMNS)
+    if request.param == 'nan columns':
+        frame['Goal'] = np.nan
+        frame['Workout_Time_per_day_mins'] = np.nan
+    return build_system(tmp_path, frame)
+
+
+@pytest.mark.parametrize('user_input', CASES.values(), ids=CASES.keys())
+def test_kernel_matches_calculate_similarity(system, user_input):
+    user_input = system.normalize_input(user_input)
+    expected = system.data.apply(lambda row: system.calculate_similarity(user_input, row), axis=1)
+    actual = system.kernel.score(user_input)
+    np.testing.assert_array_equal(actual, expected.to_numpy())
+    if expected.notna().any():
+        assert best_position(actual) == expected.idxmax()
+    else:
+        assert best_position(actual) is None
+
+
+def test_tie_picks_first_row(tmp_path):
+    system = build_system(tmp_path, pd.DataFrame(ROWS, columns=COLUMNS))
+    user_input = system.normalize_input(CASES['tie between identical rows'])
+    scores = system.kernel.score(user_input)
+    assert scores[0] == scores[1]
+    assert best_position(scores) == 0
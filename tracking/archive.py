@@ -0,0 +1,108 @@
+import logging
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+from monitoring.metrics import metrics
+from .history import from_epoch_ms
+from .registry import METRICS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = 'tracking_archive_'
+ARCHIVE_WINDOW = 50000
+# Month (YYYY_MM, server local time) of a millisecond epoch timestamp.
+MONTH = "strftime('%Y_%m', timestamp / 1000, 'unixepoch', 'localtime')"
+
+# Same columns as tracking_history.
+ARCHIVE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        value REAL NOT NULL,
+        timestamp INTEGER NOT NULL
+    )
+'''
+ARCHIVE_INDEX = 'CREATE INDEX IF NOT EXISTS {name}_user_time ON {name} (user_id, timestamp)'
+
+
+def archive_name(month: str) -> str:
+    return f'{ARCHIVE_PREFIX}{month}'
+
+
+def archive_tables(conn: sqlite3.Connection, start: Optional[int] = None, end: Optional[int] = None) -> List[str]:
+    """Archive tables, oldest first, limited to the months overlapping [start, end) when given."""
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\' ORDER BY name",
+        (ARCHIVE_PREFIX.replace('_', '\\_') + '%',))]
+    first = datetime.fromtimestamp(start / 1000).strftime('%Y_%m') if start is not None else None
+    last = datetime.fromtimestamp((end - 1) / 1000).strftime('%Y_%m') if end is not None else None
+    return [name for name in names
+            if (first is None or name[len(ARCHIVE_PREFIX):] >= first)
+            and (last is None or name[len(ARCHIVE_PREFIX):] <= last)]
+
+
+def retention_cutoff(days: int, today: Optional[date] = None) -> int:
+    """Millisecond timestamp of local midnight `days` days ago; older entries get archived."""
+    start = (today or date.today()) - timedelta(days=days)
+    return round(datetime(start.year, start.month, start.day).timestamp() * 1000)
+
+
+def archive_history(conn: sqlite3.Connection, days: int, window: int = ARCHIVE_WINDOW) -> int:
+    """Move tracking_history entries older than `days` days into per-month archive tables.
+
+    The table is walked in id windows of `window` rows, one transaction each, so
+    writers are only held up for a window at a time and no index on the timestamp
+    is needed. tracking_daily is left alone: rollups keep covering archived days.
+    Returns the number of entries moved.
+    """
+    start = time.perf_counter()
+    cutoff = retention_cutoff(days)
+    conn.commit()
+    last_id = conn.execute('SELECT coalesce(MAX(id), 0) FROM tracking_history').fetchone()[0]
+    moved = 0
+    for first in range(0, last_id, window):
+        bounds = (first, first + window, cutoff)
+        conn.execute('BEGIN IMMEDIATE')
+        months = [row[0] for row in conn.execute(
+            f'SELECT DISTINCT {MONTH} FROM tracking_history WHERE id > ? AND id <= ? AND timestamp < ?', bounds)]
+        for month in months:
+            name = archive_name(month)
+            conn.execute(ARCHIVE_TABLE.format(name=name))
+            conn.execute(ARCHIVE_INDEX.format(name=name))
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {name} (id, user_id, type, value, timestamp)
+                SELECT id, user_id, type, value, timestamp FROM tracking_history
+                WHERE id > ? AND id <= ? AND timestamp < ? AND {MONTH} = ?
+            ''', (*bounds, month))
+        if months:
+            moved += conn.execute('DELETE FROM tracking_history WHERE id > ? AND id <= ? AND timestamp < ?',
+                                  bounds).rowcount
+        conn.commit()
+    elapsed = time.perf_counter() - start
+    metrics.incr('tracking_archive.entries', moved)
+    metrics.observe('tracking_archive.seconds', elapsed)
+    logger.info(f"Archived {moved} tracking_history entries older than {days} days in {elapsed:.1f}s")
+    return moved
+
+
+def export_history(conn: sqlite3.Connection, user_id: int, types: Sequence[str],
+                   start: Optional[int] = None, end: Optional[int] = None) -> Iterator[Dict]:
+    """A user's entries of `types` in [start, end), oldest first, from the live table and the archives.
+
+    Entries are `{'type', 'value', 'timestamp'}` as /api/tracking/bulk accepts them.
+    """
+    conditions = [f"user_id = ? AND type IN ({', '.join('?' for _ in types)})"]
+    params: List = [user_id, *types]
+    if start is not None:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    where = ' AND '.join(conditions)
+    tables = ['tracking_history'] + archive_tables(conn, start, end)
+    sql = ' UNION ALL '.join(f'SELECT type, value, timestamp FROM {table} WHERE {where}' for table in tables)
+    for tracking_type, value, timestamp in conn.execute(f'{sql} ORDER BY timestamp', params * len(tables)):
+        yield {'type': tracking_type, 'value': METRICS[tracking_type].decode(value), 'timestamp': from_epoch_ms(timestamp)}
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from database.user_data import save_user_data
+from monitoring.metrics import metrics
+from .history import INSERT_HISTORY_SQL, to_epoch_ms
+from .registry import Metric
+
+logger = logging.getLogger(__name__)
+
+
+class Pending:
+    def __init__(self, value: float, goal: Optional[float]):
+        self.value = value
+        self.goal = goal
+        self.directions: List[int] = []
+        self.timestamp = None
+        self.created = time.monotonic()
+
+
+class CoalescingBuffer:
+    """Merges rapid increase/decrease clicks per (user_id, metric) into one write.
+
+    A click updates the pending entry in memory and returns the new value at once. A
+    background thread flushes entries once they are `window` seconds old (or hold
+    `max_steps` clicks), all due entries in one transaction, writing one history row
+    with the latest timestamp and one user_data update per entry. The flush replays the
+    clicks one by one on the value stored at that moment, so clamping behaves exactly as
+    if each click had been written on its own. `on_write(user_id)` is called for each
+    user whose entries a flush wrote.
+
+    Callers flush a user (`flush_user`) before reading their data, which keeps reads
+    consistent with the clicks already acknowledged; `close` flushes everything.
+    The buffer lives in one process: with several workers, a user whose requests land
+    on different workers can read up to `window` seconds behind, although no click is
+    lost because flushes replay clicks on the stored value.
+    """
+
+    def __init__(self, connect: Callable, registry: Dict[str, Metric], window: float = 1.0, max_steps: int = 100,
+                 on_write: Optional[Callable[[int], None]] = None):
+        self.connect = connect
+        self.registry = registry
+        self.window = window
+        self.max_steps = max_steps
+        self.on_write = on_write
+        self.pending: Dict[Tuple[int, str], Pending] = {}
+        self.lock = threading.Lock()
+        # Held while entries are written, so a click never reads a value a flush is replacing.
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='tracking-flush', daemon=True)
+        self.thread.start()
+
+    def read(self, user_id: int, metric: str):
+        spec = self.registry[metric]
+        conn = self.connect()
+        try:
+            return spec.current(conn.execute(spec.select_sql, (user_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def apply(self, user_id: int, metric: str, direction: int, timestamp: str) -> Tuple[float, float]:
+        """Record one click and return the metric's new value and the user's goal for it."""
+        key = (user_id, metric)
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is not None:
+                result = self.record(key, entry, direction, timestamp)
+        if entry is None:
+            with self.flush_lock:
+                value, goal = self.read(user_id, metric)
+                with self.lock:
+                    entry = self.pending.setdefault(key, Pending(value, goal))
+                    result = self.record(key, entry, direction, timestamp)
+        value, goal, full = result
+        metrics.incr('tracking_buffer.clicks')
+        if full:
+            self.flush(lambda k, e: k == key)
+        return value, goal
+
+    def record(self, key: Tuple[int, str], entry: Pending, direction: int, timestamp: str):
+        entry.value = self.registry[key[1]].advance(entry.value, direction, entry.goal)
+        entry.directions.append(direction)
+        entry.timestamp = timestamp
+        return entry.value, entry.goal, len(entry.directions) >= self.max_steps
+
+    def flush_user(self, user_id: int):
+        with self.lock:
+            waiting = any(key[0] == user_id for key in self.pending)
+        if waiting:
+            self.flush(lambda key, entry: key[0] == user_id)
+
+    def flush_due(self):
+        deadline = time.monotonic() - self.window
+        self.flush(lambda key, entry: entry.created <= deadline)
+
+    def flush(self, select: Callable[[Tuple[int, str], Pending], bool]):
+        with self.flush_lock:
+            with self.lock:
+                keys = [key for key, entry in self.pending.items() if select(key, entry)]
+                entries = [(key, self.pending.pop(key)) for key in keys]
+            if not entries:
+                return
+            start = time.perf_counter()
+            conn = None
+            try:
+                conn = self.connect()
+                conn.execute('BEGIN IMMEDIATE')
+                for (user_id, metric), entry in entries:
+                    spec = self.registry[metric]
+                    value, goal = spec.current(conn.execute(spec.select_sql, (user_id,)).fetchone())
+                    for direction in entry.directions:
+                        value = spec.advance(value, direction, goal)
+                    conn.execute(INSERT_HISTORY_SQL, (user_id, spec.history_type, spec.encode(value), to_epoch_ms(entry.timestamp)))
+                    save_user_data(conn, user_id, spec.fields(value, goal))
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Flushing {len(entries)} buffered tracking updates failed: {e}")
+                metrics.incr('tracking_buffer.flush_failures')
+                with self.lock:
+                    # Put the clicks back in front of any that arrived meanwhile.
+                    for key, entry in entries:
+                        newer = self.pending.get(key)
+                        if newer is not None:
+                            entry.directions.extend(newer.directions)
+                            entry.value, entry.timestamp = newer.value, newer.timestamp
+                        self.pending[key] = entry
+                raise
+            finally:
+                if conn is not None:
+                    conn.close()
+            if self.on_write:
+                for user_id in {user_id for (user_id, _), _ in entries}:
+                    self.on_write(user_id)
+            metrics.incr('tracking_buffer.flushed_entries', len(entries))
+            metrics.incr('tracking_buffer.flushed_clicks', sum(len(entry.directions) for _, entry in entries))
+            metrics.observe('tracking_buffer.flush_seconds', time.perf_counter() - start)
+
+    def run(self):
+        while not self.stopped.wait(self.window / 2):
+            try:
+                self.flush_due()
+            except Exception:
+                pass  # Logged by flush; the entries are retried on the next pass.
+
+    def close(self):
+        """Stop the background thread and write every pending click."""
+        self.stopped.set()
+        self.thread.join(timeout=self.window * 2)
+        self.flush(lambda key, entry: True)
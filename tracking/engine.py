@@ -0,0 +1,199 @@
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from database.user_data import save_user_data
+from monitoring.metrics import metrics
+from .archive import retention_cutoff
+from .history import INSERT_HISTORY_SQL, INSERT_NEW_HISTORY_SQL, to_epoch_ms
+from .registry import Metric
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_READINGS = 50000
+LATEST_TIMESTAMP_SQL = 'SELECT MAX(timestamp) FROM tracking_history WHERE user_id = ? AND type = ?'
+
+
+class TrackingError(ValueError):
+    """A tracking update the client has to fix; the message is returned with a 400."""
+
+
+def parse_readings(body: str) -> List:
+    """Readings from a JSON array or NDJSON (one reading per line) request body."""
+    if body.lstrip().startswith('['):
+        try:
+            readings = json.loads(body)
+        except ValueError:
+            raise TrackingError('Invalid JSON array')
+    else:
+        readings = []
+        for number, line in enumerate(body.splitlines(), 1):
+            if line.strip():
+                try:
+                    readings.append(json.loads(line))
+                except ValueError:
+                    raise TrackingError(f'Invalid JSON on line {number}')
+    if not readings:
+        raise TrackingError('No readings')
+    if len(readings) > MAX_BULK_READINGS:
+        raise TrackingError(f'At most {MAX_BULK_READINGS} readings per request')
+    return readings
+
+
+class TrackingEngine:
+    """Applies tracking update requests for any metric of the registry.
+
+    Each request runs in one transaction on the caller's pooled connection: read the
+    current value and goal, apply the action, log a history entry for value changes and
+    write user_data back. Increase/decrease clicks go to the coalescing buffer when one
+    is configured. `on_write(user_id)` is called after each commit that changed a
+    user's data. `retention_days` is the archive window (0 when nothing is archived):
+    value changes older than it are rejected and bulk readings older than it skipped,
+    since their moment may already sit in an archive table.
+    """
+
+    def __init__(self, connect: Callable, registry: Dict[str, Metric], buffer=None,
+                 on_write: Optional[Callable[[int], None]] = None, retention_days: int = 0):
+        self.connect = connect
+        self.registry = registry
+        self.buffer = buffer
+        self.on_write = on_write
+        self.retention_days = retention_days
+
+    def cutoff(self) -> Optional[int]:
+        """Timestamp before which history is archived, None when nothing is."""
+        return retention_cutoff(self.retention_days) if self.retention_days > 0 else None
+
+    def is_buffered(self, metric: Metric, action: Optional[str]) -> bool:
+        return self.buffer is not None and metric.step is not None and action in ['increase', 'decrease']
+
+    def update(self, user_id: int, name: str, data: Dict) -> Tuple[str, Dict]:
+        """Apply one update request; returns the action and the response payload."""
+        metric = self.registry[name]
+        action = data.get('action', metric.default_action)
+        timestamp = data.get('timestamp', datetime.now().isoformat())
+        try:
+            moment = to_epoch_ms(timestamp)
+        except (TypeError, ValueError):
+            logger.warning(f"{metric.label} update failed: Invalid timestamp {timestamp}")
+            raise TrackingError('Invalid timestamp format')
+        cutoff = self.cutoff()
+        if action in ['set', 'increase', 'decrease'] and cutoff is not None and moment < cutoff:
+            logger.warning(f"{metric.label} update failed: Timestamp {timestamp} is older than the retention window")
+            raise TrackingError(f'Timestamp is older than the {self.retention_days} days of history kept')
+        if self.is_buffered(metric, action):
+            value, goal = self.buffer.apply(user_id, name, 1 if action == 'increase' else -1, timestamp)
+            metrics.incr(f'tracking.{name}.buffered')
+            return action, metric.response(value, goal, timestamp)
+        conn = self.connect()
+        try:
+            # Take the write lock up front so the read-modify-write cannot interleave with another writer.
+            conn.execute('BEGIN IMMEDIATE')
+            value, goal = metric.current(conn.execute(metric.select_sql, (user_id,)).fetchone())
+            value = metric.round(value)
+            changed = False
+            if action == 'set':
+                try:
+                    value = metric.validate(data.get(metric.request_key, value), goal)
+                except (TypeError, ValueError):
+                    logger.warning(f"{metric.label} update failed: Invalid value {data.get(metric.request_key)}")
+                    raise TrackingError(metric.error.format(upper=metric.upper_bound(goal)))
+                changed = True
+            elif action in ['increase', 'decrease'] and metric.step is not None:
+                value = metric.advance(value, 1 if action == 'increase' else -1, goal)
+                changed = True
+            elif action == metric.goal_action and metric.goal_column:
+                try:
+                    goal = metric.clamp_goal(data.get(metric.goal_request_key, goal))
+                except (TypeError, ValueError):
+                    logger.warning(f"{metric.label} update failed: Invalid goal {data.get(metric.goal_request_key)}")
+                    raise TrackingError(f'{metric.label} goal must be a number')
+                if metric.goal_caps:
+                    value = metric.round(min(value, goal))
+            if changed:
+                conn.execute(INSERT_HISTORY_SQL, (user_id, metric.history_type, metric.encode(value), moment))
+            save_user_data(conn, user_id, metric.fields(value, goal))
+            conn.commit()
+        finally:
+            conn.close()
+        if self.on_write:
+            self.on_write(user_id)
+        metrics.incr(f'tracking.{name}.updates')
+        return action, metric.response(value, goal, timestamp)
+
+    def read(self, user_id: int, name: str) -> Tuple:
+        """Current value and goal of one metric for a user."""
+        metric = self.registry[name]
+        conn = self.connect()
+        try:
+            return metric.current(conn.execute(metric.select_sql, (user_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def ingest(self, user_id: int, readings: List) -> Dict:
+        """Store a batch of readings, each `{type, value, timestamp}` or `[type, value, timestamp]`.
+
+        Every reading is checked against its metric's bounds before anything is written,
+        so a batch is stored entirely or not at all. Readings the user already has for
+        that metric and moment are skipped, and so are readings older than the retention
+        window: those may sit in an archive table, out of reach of the unique index, and
+        storing them again would count them twice in tracking_daily. user_data then takes
+        the newest value of each metric in the batch, unless a newer entry was already logged.
+        """
+        start = time.perf_counter()
+        cutoff = self.cutoff()
+        expired = 0
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            current: Dict[str, Tuple] = {}
+            latest: Dict[str, Tuple[int, object]] = {}
+            rows = []
+            for position, reading in enumerate(readings):
+                if isinstance(reading, dict):
+                    name, value, timestamp = reading.get('type'), reading.get('value'), reading.get('timestamp')
+                elif isinstance(reading, list) and len(reading) == 3:
+                    name, value, timestamp = reading
+                else:
+                    raise TrackingError(f'Reading {position}: expected type, value and timestamp')
+                metric = self.registry.get(name) if isinstance(name, str) else None
+                if metric is None:
+                    raise TrackingError(f'Reading {position}: unknown type {name}')
+                try:
+                    timestamp = to_epoch_ms(timestamp)
+                except (TypeError, ValueError):
+                    raise TrackingError(f'Reading {position}: Invalid timestamp format')
+                if name not in current:
+                    current[name] = metric.current(conn.execute(metric.select_sql, (user_id,)).fetchone())
+                try:
+                    value = metric.validate(value, current[name][1])
+                except (TypeError, ValueError):
+                    raise TrackingError(f'Reading {position}: ' + metric.error.format(upper=metric.upper_bound(current[name][1])))
+                if cutoff is not None and timestamp < cutoff:
+                    expired += 1
+                    continue
+                rows.append((user_id, metric.history_type, metric.encode(value), timestamp))
+                if name not in latest or timestamp >= latest[name][0]:
+                    latest[name] = (timestamp, value)
+            inserted = conn.executemany(INSERT_NEW_HISTORY_SQL, rows).rowcount
+            updated = {}
+            for name, (timestamp, value) in latest.items():
+                metric = self.registry[name]
+                newest = conn.execute(LATEST_TIMESTAMP_SQL, (user_id, metric.history_type)).fetchone()[0]
+                if newest is not None and newest > timestamp:
+                    continue
+                goal = current[name][1]
+                save_user_data(conn, user_id, metric.fields(value, goal))
+                updated[name] = value
+            conn.commit()
+        finally:
+            conn.close()
+        if self.on_write:
+            self.on_write(user_id)
+        metrics.incr('tracking.bulk.readings', len(rows))
+        metrics.incr('tracking.bulk.inserted', inserted)
+        metrics.incr('tracking.bulk.expired', expired)
+        metrics.observe('tracking.bulk.seconds', time.perf_counter() - start)
+        return {'received': len(rows) + expired, 'inserted': inserted, 'duplicates': len(rows) - inserted,
+                'expired': expired, 'updated': updated}
@@ -0,0 +1,157 @@
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from .registry import METRICS
+
+logger = logging.getLogger(__name__)
+
+TRACKING_TYPES = ['weight', 'workout', 'steps', 'sleep', 'water', 'mood', 'exercise']
+DEFAULT_HISTORY_LIMIT = 7
+MAX_HISTORY_LIMIT = 365
+MIGRATION_BATCH_SIZE = 50000
+
+# Values are REALs (labels such as moods as their code, see Metric.encode) and
+# timestamps milliseconds since the epoch.
+HISTORY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        value REAL NOT NULL,
+        timestamp INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+'''
+
+# A user's edit of a metric at a moment they already logged replaces that entry's value.
+INSERT_HISTORY_SQL = '''
+    INSERT INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, type, timestamp) DO UPDATE SET value = excluded.value
+'''
+# Synced readings for a moment already logged are the same reading sent again.
+INSERT_NEW_HISTORY_SQL = 'INSERT OR IGNORE INTO tracking_history (user_id, type, value, timestamp) VALUES (?, ?, ?, ?)'
+
+
+def to_epoch_ms(timestamp: str) -> int:
+    """Milliseconds since the epoch of an ISO timestamp; naive ones are server local time."""
+    try:
+        return round(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"Timestamp out of range: {timestamp}") from e
+
+
+def from_epoch_ms(timestamp: Optional[int]) -> Optional[str]:
+    """Server local ISO timestamp of a stored one, as the API returns it."""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp / 1000).isoformat()
+
+
+def fetch_history(conn: sqlite3.Connection, user_id: int, types: Sequence[str] = TRACKING_TYPES,
+                  limit: int = DEFAULT_HISTORY_LIMIT, time_key: str = 'timestamp') -> Dict[str, List[Dict]]:
+    """Latest `limit` entries of each tracking type for a user, newest first, in one query.
+
+    Each type is a LIMITed branch of a UNION ALL, so SQLite seeks the (user_id, type,
+    timestamp DESC) index once per type and stops after `limit` entries. A
+    ROW_NUMBER() window would return the same rows but has to number every entry the
+    user ever logged. Entries are `{'value': ..., time_key: ...}` so callers keep
+    their own key names.
+    """
+    history: Dict[str, List[Dict]] = {tracking_type: [] for tracking_type in types}
+    branch = ('SELECT * FROM (SELECT type, value, timestamp FROM tracking_history '
+              'WHERE user_id = ? AND type = ? ORDER BY timestamp DESC LIMIT ?)')
+    params = []
+    for tracking_type in types:
+        params.extend((user_id, tracking_type, limit))
+    rows = conn.execute(' UNION ALL '.join(branch for _ in types), params)
+    for tracking_type, value, timestamp in rows:
+        history[tracking_type].append({'value': METRICS[tracking_type].decode(value), time_key: from_epoch_ms(timestamp)})
+    return history
+
+
+def parse_history_limit(value) -> int:
+    """History length requested by a client, between 1 and MAX_HISTORY_LIMIT."""
+    limit = int(value) if value not in (None, '') else DEFAULT_HISTORY_LIMIT
+    if limit < 1 or limit > MAX_HISTORY_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_HISTORY_LIMIT}")
+    return limit
+
+
+def is_legacy(conn: sqlite3.Connection) -> bool:
+    """Whether tracking_history still has the TEXT value / ISO timestamp layout."""
+    columns = {row[1]: row[2].upper() for row in conn.execute('PRAGMA table_info(tracking_history)')}
+    return columns.get('value') == 'TEXT'
+
+
+def convert_legacy(tracking_type: str, value: str, timestamp: str) -> Optional[Tuple[float, int]]:
+    """Stored value and timestamp of a legacy entry, or None if it cannot be read."""
+    metric = METRICS.get(tracking_type)
+    try:
+        return (metric.encode(value) if metric else float(value)), to_epoch_ms(str(timestamp))
+    except (TypeError, ValueError):
+        return None
+
+
+def ensure_history(conn: sqlite3.Connection, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Create tracking_history, migrating a legacy table to the typed layout first.
+
+    The migration copies entries into tracking_history_typed in id order, one batch
+    per transaction, so other connections keep reading and writing in between and an
+    interrupted run resumes where it stopped. The last step copies whatever was
+    logged meanwhile and swaps the tables in one transaction. Entries whose value or
+    timestamp cannot be parsed are dropped. Indexes and the rollup trigger are
+    recreated afterwards by the later migrations.
+    """
+    conn.commit()
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tracking_history'").fetchone():
+        conn.execute(HISTORY_TABLE.format(name='tracking_history'))
+        return
+    if not is_legacy(conn):
+        return
+    start = time.perf_counter()
+    total = conn.execute('SELECT COUNT(*) FROM tracking_history').fetchone()[0]
+    logger.info(f"Migrating {total} tracking_history entries to typed storage")
+    conn.execute(HISTORY_TABLE.format(name='tracking_history_typed'))
+    last_id = copied = skipped = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        # Another process may have finished the migration while this one waited for the lock.
+        if not is_legacy(conn):
+            conn.commit()
+            return
+        last_id, rows, dropped = copy_batch(conn, last_id, batch_size)
+        copied, skipped = copied + rows, skipped + dropped
+        if rows + dropped < batch_size:
+            # Caught up: finish inside this transaction so no new entry is missed.
+            while rows + dropped:
+                last_id, rows, dropped = copy_batch(conn, last_id, batch_size)
+                copied, skipped = copied + rows, skipped + dropped
+            conn.execute('DROP TABLE tracking_history')
+            conn.execute('ALTER TABLE tracking_history_typed RENAME TO tracking_history')
+            conn.commit()
+            break
+        conn.commit()
+        logger.info(f"Migrated {copied} of {total} tracking_history entries")
+    if skipped:
+        logger.warning(f"Dropped {skipped} tracking_history entries with unreadable values or timestamps")
+    logger.info(f"Migrated {copied} tracking_history entries in {time.perf_counter() - start:.1f}s")
+
+
+def copy_batch(conn: sqlite3.Connection, last_id: int, batch_size: int) -> Tuple[int, int, int]:
+    """Copy the legacy entries after `last_id` (or after the last one already copied).
+
+    Returns the last id read and the number of entries copied and dropped.
+    """
+    copied_id = conn.execute('SELECT MAX(id) FROM tracking_history_typed').fetchone()[0] or 0
+    rows = conn.execute('SELECT id, user_id, type, value, timestamp FROM tracking_history WHERE id > ? ORDER BY id LIMIT ?',
+                        (max(last_id, copied_id), batch_size)).fetchall()
+    converted = []
+    for id_, user_id, tracking_type, value, timestamp in rows:
+        typed = convert_legacy(tracking_type, value, timestamp)
+        if typed is not None:
+            converted.append((id_, user_id, tracking_type, *typed))
+    conn.executemany('INSERT OR IGNORE INTO tracking_history_typed (id, user_id, type, value, timestamp) VALUES (?, ?, ?, ?, ?)',
+                     converted)
+    return (rows[-1][0] if rows else max(last_id, copied_id)), len(converted), len(rows) - len(converted)
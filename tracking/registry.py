@@ -0,0 +1,144 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class Metric:
+    """Declarative description of one tracked value and how the update API changes it.
+
+    `column` (and `goal_column`) live in user_data, entries are logged to
+    tracking_history as `history_type`. 'set' reads `request_key`, casts it with
+    `cast` and rejects values outside [lower, upper] (the user's goal replaces `upper`
+    when `goal_caps`) or not in `choices`; 'increase'/'decrease' move the value by
+    `step` clamped to the same range; `goal_action` reads `goal_request_key` and clamps
+    the goal to [goal_lower, goal_upper]. `decimals` rounds the value before and after
+    each change. A metric with a `url` gets its update endpoint registered from here.
+
+    tracking_history stores every value as a REAL: numbers as they are and a label as
+    its position in `choices`, so `choices` may only ever be appended to.
+    """
+
+    def __init__(self, name: str, label: str, column: str, default, lower=None, upper=None,
+                 step: Optional[float] = None, cast: Callable = float, decimals: Optional[int] = None,
+                 choices: Optional[Sequence] = None, error: str = 'Invalid value',
+                 request_key: str = 'value', response_key: str = 'value', default_action: Optional[str] = 'set',
+                 goal_column: Optional[str] = None, goal_default=None, goal_cast: Callable = float,
+                 goal_lower=None, goal_upper=None, goal_caps: bool = False, goal_action: str = 'set_goal',
+                 goal_request_key: str = 'goal', goal_response_key: str = 'goal',
+                 history_type: Optional[str] = None, url: Optional[str] = None):
+        self.name = name
+        self.label = label
+        self.column = column
+        self.default = default
+        self.lower = lower
+        self.upper = upper
+        self.step = step
+        self.cast = cast
+        self.decimals = decimals
+        self.choices = list(choices) if choices else None
+        self.error = error
+        self.request_key = request_key
+        self.response_key = response_key
+        self.default_action = default_action
+        self.goal_column = goal_column
+        self.goal_default = goal_default
+        self.goal_cast = goal_cast
+        self.goal_lower = goal_lower
+        self.goal_upper = goal_upper
+        self.goal_caps = goal_caps
+        self.goal_action = goal_action
+        self.goal_request_key = goal_request_key
+        self.goal_response_key = goal_response_key
+        self.history_type = history_type or name
+        self.url = url
+        # Built once so every request reuses the same statements (and sqlite3's statement cache).
+        self.select_sql = f"SELECT {', '.join(self.columns())} FROM user_data WHERE user_id = ?"
+
+    def columns(self) -> List[str]:
+        return [self.column] + ([self.goal_column] if self.goal_column else [])
+
+    def fields(self, value, goal) -> Dict:
+        """user_data columns to write for a value and goal."""
+        return dict(zip(self.columns(), (value, goal)))
+
+    def current(self, row) -> Tuple:
+        """Value and goal stored in a user_data row (defaults when the user has none)."""
+        if row is None:
+            return self.default, self.goal_default
+        value = row[self.column]
+        goal = row[self.goal_column] if self.goal_column else None
+        if self.decimals is not None:
+            value, goal = float(value), (float(goal) if goal is not None else None)
+        return value, goal
+
+    def upper_bound(self, goal):
+        return goal if self.goal_caps else self.upper
+
+    def round(self, value):
+        return round(value, self.decimals) if self.decimals is not None else value
+
+    def advance(self, value, direction: int, goal):
+        """Value after one increase (direction 1) or decrease (-1) click."""
+        value = self.round(value)
+        if direction > 0:
+            value = min(value + self.step, self.upper_bound(goal))
+        else:
+            value = max(value - self.step, self.lower)
+        return self.round(value)
+
+    def validate(self, value, goal):
+        """Cast a value for 'set' and check it; raises ValueError with the metric's message."""
+        value = self.cast(value)
+        if self.choices is not None:
+            if value not in self.choices:
+                raise ValueError(self.error)
+            return value
+        if value < self.lower or value > self.upper_bound(goal):
+            raise ValueError(self.error.format(upper=self.upper_bound(goal)))
+        return self.round(value)
+
+    def clamp_goal(self, goal):
+        return self.goal_cast(max(min(self.goal_cast(goal), self.goal_upper), self.goal_lower))
+
+    def encode(self, value) -> float:
+        """Value as stored in tracking_history."""
+        if self.choices is not None:
+            return self.choices.index(value)
+        return float(value)
+
+    def decode(self, stored):
+        """Value of a tracking_history entry, as the update API returns it."""
+        if stored is None:
+            return None
+        if self.choices is not None:
+            return self.choices[int(stored)]
+        return self.cast(stored)
+
+    def response(self, value, goal, timestamp) -> Dict:
+        payload = {self.response_key: value}
+        if self.goal_column:
+            payload[self.goal_response_key] = goal
+        payload['last_updated'] = timestamp
+        return payload
+
+
+METRICS: Dict[str, Metric] = {metric.name: metric for metric in [
+    Metric('water', 'Water', 'water_intake', 1.9, lower=0, step=0.1, decimals=1,
+           error='Water intake must be between 0 and {upper} liters', response_key='intake', default_action=None,
+           goal_column='water_goal', goal_default=3.0, goal_lower=0.5, goal_upper=10, goal_caps=True,
+           goal_action='set_max', goal_request_key='max', goal_response_key='max', url='/api/update_water'),
+    Metric('weight', 'Weight', 'weight', 0, lower=0.1, upper=500, step=0.1,
+           error='Weight must be between 0.1 and 500 kg', url='/api/update_weight'),
+    Metric('workout', 'Workout', 'workout_calories', 0, lower=0, upper=2000, step=10,
+           error='Calories must be between 0 and 2000', response_key='calories',
+           goal_column='workout_goal', goal_default=500, goal_lower=100, goal_upper=2000, url='/api/update_workout'),
+    Metric('steps', 'Steps', 'steps_count', 0, lower=0, upper=100000, step=100, cast=int,
+           error='Steps must be between 0 and 100000', response_key='count',
+           goal_column='steps_goal', goal_default=10000, goal_cast=int, goal_lower=1000, goal_upper=100000,
+           url='/api/update_steps'),
+    Metric('sleep', 'Sleep', 'sleep_duration', 0, lower=0, upper=12, step=0.1,
+           error='Sleep duration must be between 0 and 12 hours', request_key='duration', response_key='duration',
+           default_action=None, goal_column='sleep_goal', goal_default=8.0, goal_lower=4, goal_upper=12,
+           url='/api/update_sleep'),
+    Metric('exercise', 'Exercise', 'exercise_hours', 0, lower=0, upper=24, step=0.1,
+           error='Exercise hours must be between 0 and 24', response_key='exercise_hours', url='/api/update_exercise'),
+    Metric('mood', 'Mood', 'mood', 'Neutral', cast=str, choices=['Happy', 'Neutral', 'Sad'], error='Invalid mood value'),
+]}
@@ -0,0 +1,190 @@
+import logging
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from .history import from_epoch_ms
+from .registry import METRICS
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ['day', 'week', 'month']
+DEFAULT_PERIOD_LIMIT = 30
+MAX_PERIOD_LIMIT = 366
+# History types whose values are labels rather than numbers; only their last value is kept.
+NON_NUMERIC_TYPES = ['mood']
+
+NUMERIC_VALUE = "CASE WHEN {source}type IN ({labels}) THEN NULL ELSE {source}value END"
+# Local calendar day of a millisecond epoch timestamp.
+DAY = "date({source}timestamp / 1000, 'unixepoch', 'localtime')"
+
+
+def numeric_value(source: str) -> str:
+    labels = ', '.join(f"'{label}'" for label in NON_NUMERIC_TYPES)
+    return NUMERIC_VALUE.format(source=source, labels=labels)
+
+
+def day_of(source: str) -> str:
+    return DAY.format(source=source)
+
+
+def ensure_rollup(conn: sqlite3.Connection):
+    """Create tracking_daily and the trigger that keeps it current, backfilling it on first creation.
+
+    tracking_daily has one row per (user_id, type, day) with the day's last value (by
+    timestamp), min, max, sum and entry count; the day is the server local date of the
+    entry's timestamp, values and timestamps are stored as in tracking_history. The
+    AFTER INSERT trigger folds every new tracking_history row into its day, so rollups stay current for every write path
+    and are kept when raw history rows are later deleted. When an entry's value is
+    replaced, the AFTER UPDATE trigger swaps it in the sum and, for the day's latest
+    entry, the last value; min and max may still reflect the replaced value.
+    """
+    columns = {row[1]: row[2].upper() for row in conn.execute('PRAGMA table_info(tracking_daily)')}
+    if columns.get('last_timestamp') == 'TEXT':
+        # Built from the legacy text history; rebuilt from the migrated entries.
+        conn.execute('DROP TABLE tracking_daily')
+        columns = {}
+    exists = bool(columns)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tracking_daily (
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            last_value REAL,
+            last_timestamp INTEGER,
+            min_value REAL,
+            max_value REAL,
+            sum_value REAL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, type, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('DROP TRIGGER IF EXISTS tracking_daily_insert')
+    conn.execute(f'''
+        CREATE TRIGGER tracking_daily_insert AFTER INSERT ON tracking_history
+        BEGIN
+            INSERT INTO tracking_daily (user_id, type, day, last_value, last_timestamp, min_value, max_value, sum_value, count)
+            SELECT NEW.user_id, NEW.type, {day_of('NEW.')}, NEW.value, NEW.timestamp,
+                   {numeric_value('NEW.')}, {numeric_value('NEW.')}, {numeric_value('NEW.')}, 1
+            WHERE true
+            ON CONFLICT (user_id, type, day) DO UPDATE SET
+                last_value = CASE WHEN excluded.last_timestamp >= last_timestamp THEN excluded.last_value ELSE last_value END,
+                last_timestamp = max(last_timestamp, excluded.last_timestamp),
+                min_value = min(coalesce(min_value, excluded.min_value), coalesce(excluded.min_value, min_value)),
+                max_value = max(coalesce(max_value, excluded.max_value), coalesce(excluded.max_value, max_value)),
+                sum_value = CASE WHEN excluded.sum_value IS NULL THEN sum_value ELSE coalesce(sum_value, 0) + excluded.sum_value END,
+                count = count + 1;
+        END
+    ''')
+    conn.execute('DROP TRIGGER IF EXISTS tracking_daily_update')
+    conn.execute(f'''
+        CREATE TRIGGER tracking_daily_update AFTER UPDATE OF value ON tracking_history
+        BEGIN
+            UPDATE tracking_daily SET
+                last_value = CASE WHEN last_timestamp = NEW.timestamp THEN NEW.value ELSE last_value END,
+                min_value = min(coalesce(min_value, {numeric_value('NEW.')}), coalesce({numeric_value('NEW.')}, min_value)),
+                max_value = max(coalesce(max_value, {numeric_value('NEW.')}), coalesce({numeric_value('NEW.')}, max_value)),
+                sum_value = sum_value - coalesce({numeric_value('OLD.')}, 0) + coalesce({numeric_value('NEW.')}, 0)
+            WHERE user_id = NEW.user_id AND type = NEW.type AND day = {day_of('NEW.')};
+        END
+    ''')
+    if not exists:
+        history_rows = conn.execute('SELECT COUNT(*) FROM tracking_history').fetchone()[0]
+        conn.execute(backfill_sql())
+        logger.info(f"Backfilled tracking_daily from {history_rows} tracking_history rows")
+
+
+def backfill_sql(where: str = '') -> str:
+    """Statement rolling the tracking_history rows matching `where` up into tracking_daily."""
+    # Ties on timestamp go to the later row, as they do in the trigger.
+    return f'''
+        INSERT INTO tracking_daily (user_id, type, day, last_value, last_timestamp, min_value, max_value, sum_value, count)
+        SELECT user_id, type, day, MAX(CASE WHEN position = 1 THEN value END), MAX(timestamp),
+               MIN(amount), MAX(amount), SUM(amount), COUNT(*)
+        FROM (
+            SELECT user_id, type, {day_of('')} AS day, value, timestamp, {numeric_value('')} AS amount,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, type, {day_of('')}
+                                      ORDER BY timestamp DESC, id DESC) AS position
+            FROM tracking_history {where}
+        )
+        GROUP BY user_id, type, day
+    '''
+
+
+def rebuild_days(conn: sqlite3.Connection, days: List[Tuple[int, str, str]]) -> int:
+    """Recompute the tracking_daily rows of (user_id, type, day) from tracking_history.
+
+    For after history rows were deleted, which the triggers do not track. Does
+    nothing before tracking_daily exists: its backfill will see the current rows.
+    Returns the number of days rebuilt.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tracking_daily'").fetchone():
+        return 0
+    rebuild = backfill_sql(f"WHERE user_id = ? AND type = ? AND {day_of('')} = ?")
+    for key in days:
+        conn.execute('DELETE FROM tracking_daily WHERE user_id = ? AND type = ? AND day = ?', key)
+        conn.execute(rebuild, key)
+    return len(days)
+
+
+def period_start(period: str, today: date, limit: int) -> date:
+    """First day of the oldest of the `limit` periods ending with the one containing `today`."""
+    if period == 'day':
+        return today - timedelta(days=limit - 1)
+    if period == 'week':
+        return today - timedelta(days=today.weekday()) - timedelta(weeks=limit - 1)
+    months = today.year * 12 + today.month - 1 - (limit - 1)
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def period_key(period: str, day: str) -> str:
+    """Label of the period containing `day`: the day, the Monday of its week, or YYYY-MM."""
+    if period == 'day':
+        return day
+    if period == 'week':
+        parsed = date.fromisoformat(day)
+        return (parsed - timedelta(days=parsed.weekday())).isoformat()
+    return day[:7]
+
+
+def aggregate(conn: sqlite3.Connection, user_id: int, tracking_type: str, period: str,
+              limit: int = DEFAULT_PERIOD_LIMIT, today: Optional[date] = None) -> List[Dict]:
+    """Per-period aggregates of one tracking type for the last `limit` periods, oldest first.
+
+    Reads one tracking_daily row per day with entries and folds the days into periods
+    in a single pass; `average` is sum / count over the period's numeric entries.
+    """
+    start = period_start(period, today or date.today(), limit)
+    rows = conn.execute('''
+        SELECT day, last_value, last_timestamp, min_value, max_value, sum_value, count
+        FROM tracking_daily
+        WHERE user_id = ? AND type = ? AND day >= ?
+        ORDER BY day
+    ''', (user_id, tracking_type, start.isoformat()))
+    buckets: List[Dict] = []
+    for day, last_value, last_timestamp, min_value, max_value, sum_value, count in rows:
+        key = period_key(period, day)
+        if not buckets or buckets[-1]['period'] != key:
+            buckets.append({'period': key, 'last': None, 'last_timestamp': None, 'min': None, 'max': None,
+                            'sum': None, 'count': 0})
+        bucket = buckets[-1]
+        if bucket['last_timestamp'] is None or last_timestamp >= bucket['last_timestamp']:
+            bucket['last'], bucket['last_timestamp'] = last_value, last_timestamp
+        if min_value is not None:
+            bucket['min'] = min_value if bucket['min'] is None else min(bucket['min'], min_value)
+            bucket['max'] = max_value if bucket['max'] is None else max(bucket['max'], max_value)
+            bucket['sum'] = sum_value if bucket['sum'] is None else bucket['sum'] + sum_value
+        bucket['count'] += count
+    metric = METRICS[tracking_type]
+    for bucket in buckets:
+        bucket['last'] = metric.decode(bucket['last'])
+        bucket['last_timestamp'] = from_epoch_ms(bucket['last_timestamp'])
+        bucket['average'] = bucket['sum'] / bucket['count'] if bucket['sum'] is not None else None
+    return buckets
+
+
+def parse_period_limit(value) -> int:
+    """Number of periods requested by a client, between 1 and MAX_PERIOD_LIMIT."""
+    limit = int(value) if value not in (None, '') else DEFAULT_PERIOD_LIMIT
+    if limit < 1 or limit > MAX_PERIOD_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_PERIOD_LIMIT}")
+    return limit